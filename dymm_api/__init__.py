@@ -5,6 +5,8 @@ from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 
 from .blueprint import register_blueprint
+from .commands import register_commands
+from .profiler import register_query_profiler
 from .custom_jwt import customize_jwt
 
 app = Flask('dymm_api')
@@ -16,4 +18,6 @@ b_crypt = Bcrypt(app)
 jwt = JWTManager(app)
 mail = Mail(app)
 register_blueprint(app)
+register_commands(app)
+register_query_profiler(app)
 customize_jwt(jwt)
@@ -0,0 +1,141 @@
+from collections import namedtuple
+
+import numpy as np
+
+MISSING_SCORE = -1
+SCORE_SCALE = 100
+MIN_GROUPS = 3
+Z_95 = 1.959964
+
+TagHistory = namedtuple('TagHistory', ['tag_ids', 'matrix', 'scores', 'days'])
+
+
+def days_in_year(year_number) -> int:
+    leap = year_number % 4 == 0 and (year_number % 100 != 0
+                                     or year_number % 400 == 0)
+    return 366 if leap else 365
+
+
+def pack_daily_scores(year_number, rows) -> bytes:
+    """Daily average cond_score of a year as little-endian int16.
+
+    rows are (day_of_year, score_sum, score_cnt). Index i holds day i + 1
+    with the average times SCORE_SCALE, days without a score hold
+    MISSING_SCORE.
+    """
+    packed = np.full(days_in_year(year_number), MISSING_SCORE, dtype='<i2')
+    if rows:
+        days, sums, cnts = np.array(rows, dtype=np.int64).T
+        scored = (cnts > 0) & (days >= 1) & (days <= packed.size)
+        packed[days[scored] - 1] = np.rint(
+            sums[scored] * SCORE_SCALE / cnts[scored])
+    return packed.tobytes()
+
+
+def load_tag_history(rows) -> TagHistory:
+    """Arrange an avatar's scored log groups for the impact statistics.
+
+    rows are (group_id, log_date, cond_score, tag_id) in chronological order,
+    one per active tag log plus a tag_id of None for groups without any.
+    matrix[g, t] is True when group g logged tag_ids[t]; scores and days
+    (proleptic ordinals of log_date) follow the same group order.
+    """
+    if not rows:
+        return TagHistory(np.empty(0, np.int64), np.empty((0, 0), bool),
+                          np.empty(0), np.empty(0, np.int64))
+    group_ids, dates, scores, tag_ids = zip(*rows)
+    group_ids = np.array(group_ids, dtype=np.int64)
+    tag_ids = np.array([tag_id or 0 for tag_id in tag_ids], dtype=np.int64)
+    starts = np.empty(group_ids.size, dtype=bool)
+    starts[0] = True
+    np.not_equal(group_ids[1:], group_ids[:-1], out=starts[1:])
+    positions = np.cumsum(starts) - 1
+    first_rows = np.flatnonzero(starts)
+    logged = tag_ids > 0
+    unique_tags, columns = np.unique(tag_ids[logged], return_inverse=True)
+    matrix = np.zeros((first_rows.size, unique_tags.size), dtype=bool)
+    matrix[positions[logged], columns] = True
+    return TagHistory(
+        tag_ids=unique_tags,
+        matrix=matrix,
+        scores=np.array([scores[i] for i in first_rows], dtype=np.float64),
+        days=np.array([dates[i].toordinal() for i in first_rows],
+                      dtype=np.int64)
+    )
+
+
+def _score_effect(matrix, scores):
+    # Per column: groups with the tag, mean score with and without it and
+    # the Welch standard error of the difference.
+    x = matrix.astype(np.float64)
+    n_with = x.sum(axis=0)
+    n_without = scores.size - n_with
+    sum_with = scores @ x
+    sq_with = (scores * scores) @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_with = sum_with / n_with
+        mean_without = (scores.sum() - sum_with) / n_without
+        var_with = (sq_with - n_with * mean_with ** 2) / (n_with - 1)
+        var_without = ((scores * scores).sum() - sq_with
+                       - n_without * mean_without ** 2) / (n_without - 1)
+        se = np.sqrt(np.maximum(var_with, 0) / n_with
+                     + np.maximum(var_without, 0) / n_without)
+    se[(n_with < 2) | (n_without < 2)] = np.nan
+    return n_with, mean_with, mean_without, mean_with - mean_without, se
+
+
+def _or_none(value):
+    return None if np.isnan(value) else round(float(value), 3)
+
+
+def compute_tag_impacts(history: TagHistory) -> [dict]:
+    """Score effect of every tag logged in at least MIN_GROUPS groups.
+
+    score_diff compares the groups that logged the tag with the ones that
+    did not, ci_low and ci_high bound it at 95%. lag_diff does the same for
+    the score of the following group, counting only pairs at most one day
+    apart.
+    """
+    if not history.tag_ids.size:
+        return list()
+    n_with, avg_with, avg_without, diff, se = _score_effect(
+        history.matrix, history.scores)
+    pairs = np.flatnonzero(np.diff(history.days) <= 1)
+    lag_cnt, _, _, lag_diff, _ = _score_effect(
+        history.matrix[pairs], history.scores[pairs + 1])
+    impacts = list()
+    for idx in np.flatnonzero(n_with >= MIN_GROUPS):
+        impacts.append(dict(
+            tag_id=int(history.tag_ids[idx]),
+            group_cnt=int(n_with[idx]),
+            lag_cnt=int(lag_cnt[idx]),
+            avg_with=_or_none(avg_with[idx]),
+            avg_without=_or_none(avg_without[idx]),
+            score_diff=_or_none(diff[idx]),
+            lag_diff=_or_none(lag_diff[idx]),
+            ci_low=_or_none(diff[idx] - Z_95 * se[idx]),
+            ci_high=_or_none(diff[idx] + Z_95 * se[idx])
+        ))
+    return impacts
+
+
+def full_lifespan_days(scores) -> np.ndarray:
+    """Vectorized Helpers.get_remaining_life_span over integer scores.
+
+    scores are average cond_scores already rounded to two decimals with the
+    point dropped, as the endpoint does; the result is rounded to whole
+    days the same way.
+    """
+    score = np.asarray(scores, dtype=np.int64)
+    span_days = np.select(
+        [(score > 840) & (score < 1000),
+         score == 840,
+         (score >= 740) & (score <= 839),
+         (score >= 640) & (score <= 739)],
+        [365 * 200 - (1000 - score) * 109.5,
+         365 * 150,
+         365 * 150 - (840 - score) * 73,
+         365 * 130 - (740 - score) * 109.5],
+        default=365 * 100 - (640 - score) * 36.5
+    )
+    return np.rint(span_days).astype(np.int64)
@@ -1,4 +1,4 @@
-import os, datetime, pytz
+import os, base64, datetime, pytz
 from flask import request, render_template, Blueprint, send_file, send_from_directory
 from flask_jwt_extended import (create_access_token, get_jwt_identity,
                                 jwt_refresh_token_required, jwt_required)
@@ -6,18 +6,23 @@ from google.cloud import storage
 import tempfile
 
 from dymm_api import b_crypt
-from .errors import ok, forbidden, bad_req, unauthorized
+from .errors import (ok, forbidden, bad_req, unauthorized, gzip_body, ok_gzip,
+                     is_not_modified, not_modified, ok_stream, ok_binary)
 from .patterns import (MsgPattern, RegExPattern, ErrorPattern, TagType,
-                       BookmarkSuperTag, TagClass, TagId, AvatarInfo)
+                       BookmarkSuperTag, TagClass, TagId, AvatarInfo,
+                       PeriodType)
 from .schemas import Schema, validate_schema
 from .mail import (confirm_mail_token, send_conf_mail, send_verif_mail,
                    verify_mail_code)
-from .helpers import Helpers, str_to_bool
+from .helpers import Helpers, str_to_bool, make_etag
+from .idempotency import idempotent
+from .analytics import pack_daily_scores, MISSING_SCORE, SCORE_SCALE
 
 avt_api = Blueprint('avt_api', __name__, url_prefix='/api/avatar')
 bnr_api = Blueprint('bnr_api', __name__, url_prefix='/api/banner')
 mail_api = Blueprint('mail_api', __name__, url_prefix='/api/mail')
 tag_api = Blueprint('tag_api', __name__, url_prefix='/api/tag')
+task_api = Blueprint('task_api', __name__, url_prefix='/api/task')
 _m = MsgPattern()
 _r = RegExPattern()
 _e = ErrorPattern()
@@ -25,6 +30,24 @@ _h = Helpers()
 _s = Schema()
 
 
+def check_log_group_period(avatar_id, year_number, month_number,
+                           week_of_year=None):
+    if not avatar_id:
+        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    if not year_number:
+        return bad_req(_m.EMPTY_PARAM.format('year_number'))
+    if not month_number:
+        return bad_req(_m.EMPTY_PARAM.format('month_number'))
+    if len(str(year_number)) != 4 or year_number < 1960:
+        return bad_req(_m.BAD_PARAM.format('year_number'))
+    if month_number < 1 or month_number > 12:
+        return bad_req(_m.BAD_PARAM.format('month_number'))
+    if week_of_year:
+        if week_of_year < 1 or week_of_year > 54:
+            return bad_req(_m.BAD_PARAM.format('week_of_year'))
+    return None
+
+
 # GET services
 # -----------------------------------------------------------------------------
 @avt_api.route('/<int:avatar_id>', methods=['GET'])
@@ -68,9 +91,28 @@ def fetch_avatar_profile(avatar_id=None):
 def fetch_avatar_cond_list(avatar_id=None):
     if avatar_id is None:
         return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    last_modified, total = _h.get_avt_cond_list_version(avatar_id)
+    etag = make_etag('avt-cond', avatar_id, last_modified, total,
+                     _h.get_taxonomy_version())
+    if is_not_modified(etag):
+        return not_modified(etag)
     avt_cond_list = _h.get_avt_cond_list(avatar_id)
     avt_cond_list_js = _h.convert_avt_cond_list_into_js(avt_cond_list)
-    return ok(avt_cond_list_js)
+    return ok(avt_cond_list_js, etag=etag)
+
+
+@avt_api.route('/<int:avatar_id>/sync', methods=['GET'])
+@jwt_required
+def fetch_sync_changes(avatar_id=None):
+    if avatar_id is None:
+        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    try:
+        changes, next_cursor, has_more = _h.get_sync_changes(
+            avatar_id, request.args.get('cursor'))
+    except ValueError:
+        return bad_req(_m.BAD_PARAM)
+    changes_js = _h.convert_sync_changes_into_js(changes)
+    return ok(dict(changes_js, next_cursor=next_cursor, has_more=has_more))
 
 
 @avt_api.route('/<int:avatar_id>/group/<int:year_number>/<int:month_number>/'
@@ -80,25 +122,35 @@ def fetch_avatar_cond_list(avatar_id=None):
 @jwt_required
 def fetch_log_groups(avatar_id=None, year_number=None, month_number=None,
                      week_of_year=None):
-    if not avatar_id:
-        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
-    if not year_number:
-        return bad_req(_m.EMPTY_PARAM.format('year_number'))
-    if not month_number:
-        return bad_req(_m.EMPTY_PARAM.format('month_number'))
-    if len(str(year_number)) != 4 or year_number < 1960:
-        return bad_req(_m.BAD_PARAM.format('year_number'))
-    if month_number < 1 or month_number > 12:
-        return bad_req(_m.BAD_PARAM.format('month_number'))
-    if week_of_year:
-        if week_of_year < 1 or week_of_year > 54:
-            return bad_req(_m.BAD_PARAM.format('week_of_year'))
+    invalid = check_log_group_period(avatar_id, year_number, month_number,
+                                     week_of_year)
+    if invalid:
+        return invalid
     log_groups = _h.get_log_groups(avatar_id, year_number, month_number,
                                    week_of_year)
     log_groups_js = _h.convert_log_groups_into_js(log_groups)
     return ok(log_groups_js)
 
 
+@avt_api.route('/<int:avatar_id>/calendar/<int:year_number>/<int:month_number>/'
+               '<int:week_of_year>', methods=['GET'])
+@avt_api.route('/<int:avatar_id>/calendar/<int:year_number>/<int:month_number>',
+               methods=['GET'])
+@jwt_required
+def fetch_log_group_calendar(avatar_id=None, year_number=None,
+                             month_number=None, week_of_year=None):
+    invalid = check_log_group_period(avatar_id, year_number, month_number,
+                                     week_of_year)
+    if invalid:
+        return invalid
+    log_groups = _h.get_log_groups(avatar_id, year_number, month_number,
+                                   week_of_year)
+    rows = list()
+    if log_groups:
+        rows = _h.get_groups_of_logs([log_group.id for log_group in log_groups])
+    return ok_stream(_h.convert_calendar_into_js(log_groups, rows))
+
+
 @avt_api.route('/<int:avatar_id>/group-note/<int:page>')
 def fetch_log_group_notes(avatar_id=None, page=None):
     if avatar_id is None:
@@ -110,24 +162,47 @@ def fetch_log_group_notes(avatar_id=None, page=None):
     return ok(log_groups_js)
 
 
+@avt_api.route('/<int:avatar_id>/group-note', methods=['GET'])
+@jwt_required
+def fetch_log_group_note_page(avatar_id=None):
+    if avatar_id is None:
+        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    try:
+        log_groups, next_cursor = _h.get_log_group_note_page(
+            avatar_id, request.args.get('cursor'))
+    except ValueError:
+        return bad_req(_m.BAD_PARAM)
+    log_groups_js = _h.convert_log_groups_into_js(log_groups)
+    return ok(dict(log_groups=log_groups_js, next_cursor=next_cursor))
+
+
+@avt_api.route('/<int:avatar_id>/group-note/search', methods=['POST'])
+@jwt_required
+def search_log_group_notes(avatar_id=None):
+    if avatar_id is None:
+        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    result = validate_schema(request.get_json(), _s.note_key_word)
+    if not result['ok']:
+        return bad_req(result['message'])
+    data = result['data']
+    try:
+        rows, next_cursor = _h.search_log_group_notes(
+            avatar_id, data['key_word'], data.get('cursor'))
+    except ValueError:
+        return bad_req(_m.BAD_PARAM)
+    log_groups_js = _h.convert_note_hits_into_js(rows)
+    return ok(dict(log_groups=log_groups_js, next_cursor=next_cursor))
+
+
 @avt_api.route('/group/<int:group_id>/log', methods=['GET'])
 @jwt_required
 def fetch_group_of_logs(group_id=None):
     if not group_id:
         return bad_req(_m.EMPTY_PARAM.format('group_id'))
-    log_group = _h.get_a_log_group(group_id)
-    logs_js = dict(group_id=log_group.id)
-    if log_group.food_cnt > 0:
-        food_logs = _h.get_tag_logs(log_group.id, TagType.food)
-        logs_js['food_logs'] = _h.convert_tag_logs_into_js(food_logs)
-    if log_group.act_cnt > 0:
-        act_logs = _h.get_tag_logs(log_group.id, TagType.activity)
-        logs_js['act_logs'] = _h.convert_tag_logs_into_js(act_logs)
-    if log_group.drug_cnt > 0:
-        drug_logs = _h.get_tag_logs(log_group.id, TagType.drug)
-        logs_js['drug_logs'] = _h.convert_tag_logs_into_js(drug_logs)
-    if log_group.cond_score is not None:
-        logs_js['cond_score'] = log_group.cond_score
+    rows = _h.get_groups_of_logs([group_id])
+    if not rows:
+        return forbidden(message=_m.NONEXISTENT.format(group_id))
+    logs_js = _h.convert_groups_of_logs_into_js(rows)[0]
     return ok(logs_js)
 
 
@@ -151,38 +226,92 @@ def fetch_log_group_avg_cond_score(avatar_id=None, year_number=None,
             this_avg_score=this_avg
         ))
     if week_of_year:
-        this_avg = _h.get_avg_score_per_week(avatar_id, year_number,
-                                             week_of_year)
-        if week_of_year == 1:
-            week_of_year = 52
-            year_number -= year_number
-        else:
-            week_of_year -= 1
-        last_avg = _h.get_avg_score_per_week(avatar_id, year_number,
-                                             week_of_year)
+        series = _h.get_score_series(avatar_id, PeriodType.week, year_number,
+                                     week_of_year, 2)
     else:
-        this_avg = _h.get_avg_score_per_month(avatar_id, year_number,
-                                              month_number)
-        if month_number == 1:
-            year_number -= year_number
-            month_number = 12
-        else:
-            month_number -= 1
-        last_avg = _h.get_avg_score_per_month(avatar_id, year_number, month_number)
-    if this_avg.avg_score is None:
+        series = _h.get_score_series(avatar_id, PeriodType.month,
+                                     year_number, month_number, 2)
+    (_, _, last_avg), (_, _, this_avg) = series
+    if this_avg is None:
         this_avg = "0.000"
     else:
-        this_avg = str(this_avg.avg_score)
-    if last_avg.avg_score is None:
+        this_avg = str(this_avg)
+    if last_avg is None:
         last_avg = "0.000"
     else:
-        last_avg = str(last_avg.avg_score)
+        last_avg = str(last_avg)
     return ok(dict(
         this_avg_score=this_avg,
         last_avg_score=last_avg
     ))
 
 
+@avt_api.route('/<int:avatar_id>/score-series/<period>/<int:year_number>',
+               methods=['GET'])
+@avt_api.route('/<int:avatar_id>/score-series/<period>/<int:year_number>/'
+               '<int:period_number>', methods=['GET'])
+@jwt_required
+def fetch_score_series(avatar_id=None, period=None, year_number=None,
+                       period_number=0):
+    period_types = dict(week=PeriodType.week, month=PeriodType.month,
+                        year=PeriodType.year)
+    max_numbers = dict(week=53, month=12, year=0)
+    if period not in period_types:
+        return bad_req(_m.BAD_PARAM.format('period'))
+    if len(str(year_number)) != 4 or year_number < 1960:
+        return bad_req(_m.BAD_PARAM.format('year_number'))
+    if period == 'year':
+        period_number = 0
+    elif not 1 <= period_number <= max_numbers[period]:
+        return bad_req(_m.BAD_PARAM.format('period_number'))
+    count = request.args.get('count', 12, type=int)
+    if not 1 <= count <= 104:
+        return bad_req(_m.BAD_PARAM.format('count'))
+    series = _h.get_score_series(avatar_id, period_types[period],
+                                 year_number, period_number, count + 1)
+    return ok(_h.convert_score_series_into_js(series))
+
+
+@avt_api.route('/<int:avatar_id>/heatmap/<int:year_number>', methods=['GET'])
+@jwt_required
+def fetch_score_heatmap(avatar_id=None, year_number=None):
+    if len(str(year_number)) != 4 or year_number < 1960:
+        return bad_req(_m.BAD_PARAM.format('year_number'))
+    out_format = request.args.get('format', 'base64')
+    if out_format not in ('base64', 'binary'):
+        return bad_req(_m.BAD_PARAM.format('format'))
+    rows = _h.get_daily_scores(avatar_id, year_number)
+    packed = pack_daily_scores(year_number, rows)
+    if out_format == 'binary':
+        return ok_binary(packed, {'X-Score-Scale': str(SCORE_SCALE),
+                                  'X-Score-Missing': str(MISSING_SCORE)})
+    return ok(dict(year_number=year_number,
+                   days=len(packed) // 2,
+                   dtype='int16le',
+                   scale=SCORE_SCALE,
+                   missing=MISSING_SCORE,
+                   scores=base64.b64encode(packed).decode()))
+
+
+@avt_api.route('/<int:avatar_id>/tag-impact', methods=['GET'])
+@jwt_required
+def fetch_tag_impacts(avatar_id=None):
+    if avatar_id is None:
+        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    tag_impacts = _h.get_tag_impacts(avatar_id)
+    return ok(_h.convert_tag_impacts_into_js(tag_impacts))
+
+
+@avt_api.route('/<int:avatar_id>/tag-impact', methods=['POST'])
+@jwt_required
+def post_tag_impacts(avatar_id=None):
+    if avatar_id is None:
+        return bad_req(_m.EMPTY_PARAM.format('avatar_id'))
+    _h.update_tag_impacts(avatar_id)
+    tag_impacts = _h.get_tag_impacts(avatar_id)
+    return ok(_h.convert_tag_impacts_into_js(tag_impacts))
+
+
 @avt_api.route('/<int:avatar_id>/group/<int:year_number>/score-board',
                methods=['GET'])
 @avt_api.route('/<int:avatar_id>/group/<int:year_number>/<int:month_number>/'
@@ -218,9 +347,13 @@ def fetch_main_score_board_info(avatar_id=None, year_number=None,
 
 @bnr_api.route('', methods=['GET'])
 def fetch_banners():
+    last_modified, total = _h.get_banners_version()
+    etag = make_etag('banner', last_modified, total)
+    if is_not_modified(etag):
+        return not_modified(etag)
     banners = _h.get_banners()
     banners_js = _h.convert_banners_into_js(banners)
-    return ok(data=banners_js)
+    return ok(data=banners_js, etag=etag)
 
 
 @mail_api.route('/conf/<token>', methods=['GET'])
@@ -267,23 +400,43 @@ def fetch_tag_sets(tag_id=None, sort_type=None, avatar_id=None, page=None):
             bookmarks = _h.get_bookmarks(avatar_id, tag.id)
             bookmarks_js = _h.convert_bookmarks_into_js(bookmarks)
             return ok(dict(tag=tag_js, sub_tags=bookmarks_js))
-    if tag.class1 == TagClass.drug and tag.division1 != 0:
+    if tag.class1 == TagClass.drug and tag.hierarchy_depth > 0:
         sort_type = 'eng'
-    tag_sets = _h.get_tag_sets(tag.id, sort_type, page)
-    tag_sets_js = _h.convert_tag_sets_into_js(tag_sets)
+    cursor = request.args.get('cursor')
     bookmarks_total = _h.get_bookmarks_total(tag_id)
+    bookmark = None
     if avatar_id:
         if (tag.tag_type == TagType.food
                 or tag.tag_type == TagType.activity
                 or tag.tag_type == TagType.drug
                 or tag.tag_type == TagType.condition):
             bookmark = _h.get_a_bookmark(avatar_id=avatar_id, tag_id=tag_id)
-            if bookmark:
-                return ok(dict(tag=tag_js, sub_tags=tag_sets_js,
-                               bookmark_id=bookmark.id,
-                               bookmarks_total=bookmarks_total))
+    version = _h.get_taxonomy_version()
+    etag = make_etag('tag-sets', version, tag_id, sort_type, page, cursor,
+                     bookmarks_total, bookmark.id if bookmark else None)
+    if is_not_modified(etag):
+        return not_modified(etag)
+    paging = dict()
+    if cursor is not None and page is None:
+        try:
+            tag_sets, next_cursor = _h.get_tag_set_page(tag.id, sort_type,
+                                                        cursor)
+        except ValueError:
+            return bad_req(_m.BAD_PARAM)
+        paging['next_cursor'] = next_cursor
+    else:
+        tag_sets = _h.get_tag_sets(tag.id, sort_type, page)
+    if tag_sets is False:
+        return bad_req(_m.BAD_PARAM)
+    tag_sets_js = _h.convert_tag_sets_into_js(tag_sets)
+    if bookmark:
+        return ok(dict(tag=tag_js, sub_tags=tag_sets_js,
+                       bookmark_id=bookmark.id,
+                       bookmarks_total=bookmarks_total, **paging),
+                  etag=etag)
     return ok(dict(tag=tag_js, sub_tags=tag_sets_js,
-                   bookmarks_total=bookmarks_total))
+                   bookmarks_total=bookmarks_total, **paging),
+              etag=etag)
 
 
 @tag_api.route('/<int:tag_id>/set/match/<is_selected>', methods=['GET'])
@@ -291,16 +444,43 @@ def fetch_tag_sets(tag_id=None, sort_type=None, avatar_id=None, page=None):
 def fetch_tag_sets_w_matching_idx(tag_id=None, is_selected=None):
     if tag_id is None:
         return bad_req(_m.EMPTY_PARAM.format('fact_id'))
+    version = _h.get_taxonomy_version()
+    etag = make_etag('tag-sets-match', version, tag_id,
+                     str_to_bool(is_selected))
+    if is_not_modified(etag):
+        return not_modified(etag)
     if not str_to_bool(is_selected):
         tag_sets = _h.get_tag_sets(tag_id, 'priority')
         tags_js, matching_idx = _h.convert_tag_sets_into_js_add_idx(
             tag_sets, tag_id)
-        return ok(dict(sub_tags=tags_js, select_idx=matching_idx))
+        return ok(dict(sub_tags=tags_js, select_idx=matching_idx),
+                  etag=etag)
     super_tag = _h.get_a_super_tag(tag_id)
     tag_sets = _h.get_tag_sets(super_tag.id, 'priority')
     tags_js, matching_idx = _h.convert_tag_sets_into_js_add_idx(
         tag_sets, tag_id)
-    return ok(dict(sub_tags=tags_js, select_idx=matching_idx))
+    return ok(dict(sub_tags=tags_js, select_idx=matching_idx),
+              etag=etag)
+
+
+@tag_api.route('/snapshot', methods=['GET'])
+def fetch_taxonomy_snapshot():
+    version = _h.get_taxonomy_version()
+    if is_not_modified(version):
+        return not_modified(version)
+    version, body = _h.get_taxonomy_snapshot()
+    return ok_gzip(body, etag=version)
+
+
+@tag_api.route('/snapshot/<version>/delta', methods=['GET'])
+def fetch_taxonomy_delta(version=None):
+    if version is None:
+        return bad_req(_m.EMPTY_PARAM.format('version'))
+    try:
+        delta_js = _h.get_taxonomy_delta(version)
+    except ValueError:
+        return bad_req(_m.BAD_PARAM)
+    return ok_gzip(gzip_body(delta_js))
 
 
 @avt_api.route('/<int:avatar_id>/profile/photo/<photo_name>')
@@ -341,9 +521,6 @@ def fetch_remaining_life_span(avatar_id=None):
     full_lifespan_day = _h.get_remaining_life_span(int(str_score))
     full_lifespan_day = int(format(full_lifespan_day, '.0f'))
 
-    # It's logging the full_lifespan_day into avatar table for ranking
-    _h.update_avatar_info(avatar, AvatarInfo.full_lifespan, full_lifespan_day)
-
     date_of_birth = datetime.datetime(avatar.date_of_birth.year,
                                       avatar.date_of_birth.month,
                                       avatar.date_of_birth.day)
@@ -460,23 +637,20 @@ def find_old_email(option=None):
 
 @avt_api.route('/cond', methods=['POST'])
 @jwt_required
+@idempotent
 def post_avatar_cond():
     result = validate_schema(request.get_json(), _s.create_avatar_cond)
     if not result['ok']:
         return bad_req(result['message'])
     data = result['data']
-    _h.create_cond_log(data)
-    log_history = _h.get_a_log_history_even_inactive(data['avatar_id'],
-                                                     data['tag_id'])
-    if log_history:
-        _h.update_log_history_date(log_history)
-    else:
-        _h.create_a_log_history(data['avatar_id'], data['tag_id'])
+    if not _h.create_cond_log(data):
+        return forbidden(message=_m.NONEXISTENT.format(data['tag_id']))
     return ok()
 
 
 @avt_api.route('/bookmark', methods=['POST'])
 @jwt_required
+@idempotent
 def post_bookmark():
     result = validate_schema(request.get_json(), _s.create_bookmark)
     if not result['ok']:
@@ -509,19 +683,38 @@ def post_bookmark():
 
 @avt_api.route('/log', methods=['POST'])
 @jwt_required
+@idempotent
 def post_new_log():
     result = validate_schema(request.get_json(), _s.create_log)
     if not result['ok']:
         return bad_req(result['message'])
     data = result['data']
-    _h.create_log(data)
-    log_history = _h.get_a_log_history_even_inactive(data['avatar_id'],
-                                                     data['tag_id'])
-    if log_history:
-        _h.update_log_history_date(log_history)
-    else:
-        _h.create_a_log_history(data['avatar_id'], data['tag_id'])
-    return ok()
+    log = _h.create_log(data)
+    if log is None:
+        return forbidden(message=_m.NONEXISTENT.format(
+            data.get('log_group_id') or data['tag_id']))
+    return ok(log)
+
+
+@avt_api.route('/log/bulk', methods=['POST'])
+@jwt_required
+def post_new_logs():
+    result = validate_schema(request.get_json(), _s.create_logs)
+    if not result['ok']:
+        return bad_req(result['message'])
+    data = result['data']
+    results = _h.create_logs(data['logs'])
+    return ok(dict(results=results))
+
+
+@avt_api.route('/group/log', methods=['POST'])
+@jwt_required
+def fetch_groups_of_logs():
+    result = validate_schema(request.get_json(), _s.group_ids)
+    if not result['ok']:
+        return bad_req(result['message'])
+    rows = _h.get_groups_of_logs(result['data']['group_ids'])
+    return ok(_h.convert_groups_of_logs_into_js(rows))
 
 
 @mail_api.route('/conf-link', methods=['POST'])
@@ -560,6 +753,26 @@ def search_tags(tag_id=None, page=None):
     return ok(dict(tag=tag_js, sub_tags=tags_js))
 
 
+@tag_api.route('/<int:tag_id>/autocomplete', methods=['POST'])
+def autocomplete_tags(tag_id=None):
+    if tag_id is None:
+        return bad_req(_m.EMPTY_PARAM.format('tag_id'))
+    result = validate_schema(request.get_json(), _s.autocomplete_key_word)
+    if not result['ok']:
+        return bad_req(result['message'])
+    data = result['data']
+    super_tag = _h.get_a_tag(tag_id)
+    if super_tag is None:
+        return forbidden(message=_m.NONEXISTENT.format(tag_id))
+    tags = _h.autocomplete_tags(super_tag, data['key_word'],
+                                data.get('locale'), data.get('limit', 10))
+    if tags is False:
+        return bad_req(_m.BAD_PARAM)
+    tags_js = _h.convert_tags_into_js(tags)
+    return ok(dict(tag=_h.convert_a_tag_into_js(super_tag),
+                   sub_tags=tags_js))
+
+
 # Unwrap when test on localhost
 # @avt_api.route('/<int:avatar_id>/profile-img', methods=['POST'])
 # def upload_profile_image1(avatar_id=None):
@@ -715,8 +928,18 @@ def put_log_group(group_id=None, option=None):
 def put_a_group_of_log(tag_log_id=None):
     if tag_log_id is None:
         return bad_req(_m.EMPTY_PARAM.format('tag_log_id'))
-    tag_log = _h.get_a_tag_log(tag_log_id)
-    _h.update_tag_log(tag_log)
-    log_group = _h.get_a_log_group(tag_log.group_id)
-    _h.update_log_group_log_cnt(log_group, tag_log.tag.tag_type)
+    if not _h.update_tag_log(tag_log_id):
+        return forbidden(message=_m.NONEXISTENT.format(tag_log_id))
     return ok()
+
+
+# Scheduled tasks
+# -----------------------------------------------------------------------------
+@task_api.route('/recompute-lifespans', methods=['GET'])
+def run_recompute_lifespans():
+    # App Engine strips X-Appengine-Cron from outside requests, so only the
+    # cron service can send it.
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        return forbidden()
+    total = _h.update_full_lifespans()
+    return ok(dict(total=total))
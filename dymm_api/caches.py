@@ -0,0 +1,294 @@
+import threading, time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from dymm_api import db
+from .models import Tag, TagSet
+from .indexes import NgramIndex, PrefixTrie, build_prefix_trie
+
+db_session = db.session
+
+CachedTag = namedtuple('CachedTag', [
+    'id', 'tag_type', 'is_active', 'eng_name', 'kor_name', 'jpn_name',
+    'class1', 'division1', 'division2', 'division3', 'division4', 'division5',
+    'hierarchy_path', 'hierarchy_depth'
+])
+CachedTagSet = namedtuple('CachedTagSet', [
+    'id', 'super_id', 'sub_id', 'priority', 'sub'
+])
+
+_TAG_COLUMNS = (Tag.id, Tag.tag_type, Tag.is_active, Tag.eng_name,
+                Tag.kor_name, Tag.jpn_name, Tag.class1, Tag.division1,
+                Tag.division2, Tag.division3, Tag.division4, Tag.division5,
+                Tag.hierarchy_path, Tag.hierarchy_depth)
+_SORT_COLUMNS = dict(eng=Tag.eng_name,
+                     kor=Tag.kor_name,
+                     jpn=Tag.jpn_name,
+                     priority=TagSet.priority.desc())
+SORT_TYPES = ('eng', 'kor', 'jpn', 'priority')
+_MISSING = object()
+
+
+class LRUDict(object):
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+class TagChildren(object):
+    """Active children of one super tag, presorted once per sort type.
+
+    The order of each list comes from Postgres (row_number() over the same
+    ORDER BY get_tag_sets always used), so collation matches the old queries.
+    """
+    __slots__ = ('sorted', 'positions', 'sub_ids')
+
+    def __init__(self, tag_sets, ranks):
+        self.sorted = dict()
+        self.positions = dict()
+        for idx, sort_type in enumerate(SORT_TYPES):
+            order = sorted(range(len(tag_sets)), key=lambda i: ranks[i][idx])
+            self.sorted[sort_type] = tuple(tag_sets[i] for i in order)
+            self.positions[sort_type] = {
+                tag_set.sub_id: pos
+                for pos, tag_set in enumerate(self.sorted[sort_type])
+            }
+        self.sub_ids = frozenset(tag_set.sub_id for tag_set in tag_sets)
+
+    def page_after(self, sort_type, after=None, limit=40):
+        tag_sets = self.sorted[sort_type]
+        start = 0
+        if after is not None:
+            sub_id, position = after
+            idx = self.positions[sort_type].get(sub_id)
+            if idx is None:
+                # The row has gone since the cursor was issued, resume at the
+                # position it used to be.
+                start = min(position, len(tag_sets))
+            else:
+                start = idx + 1
+        has_more = start + limit < len(tag_sets)
+        return tag_sets[start:start + limit], start, has_more
+
+
+class TaxonomyCache(object):
+    """Read-mostly, per-process cache of the Tag/TagSet tree.
+
+    Entries are plain named tuples, so they can be shared between requests
+    without being bound to any session. The whole cache is dropped when the
+    taxonomy version (latest modification and row count of `tag` and
+    `tag_set`) changes; the version is checked at most once every
+    TAXONOMY_CACHE_TTL seconds.
+    """
+
+    def __init__(self, max_tags=30000, max_parents=30000, max_children=3000):
+        self._lock = threading.RLock()
+        self._tags = LRUDict(max_tags)
+        self._parents = LRUDict(max_parents)
+        self._children = LRUDict(max_children)
+        self._indexes = dict()
+        self._build_lock = threading.RLock()
+        self._checked_at = None
+        self.version = None
+
+    # Version check
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def fetch_version():
+        def latest(model):
+            return db_session.query(func.max(func.coalesce(
+                model.modified_timestamp, model.created_timestamp
+            ))).as_scalar()
+
+        def total(model):
+            return db_session.query(func.count(model.id)).as_scalar()
+
+        version = db_session.query(
+            latest(Tag), total(Tag), latest(TagSet), total(TagSet)
+        ).first()
+        return tuple(version)
+
+    def refresh(self, force=False):
+        ttl = current_app.config.get('TAXONOMY_CACHE_TTL', 30)
+        now = time.monotonic()
+        if (not force and self._checked_at is not None
+                and now - self._checked_at < ttl):
+            return self.version
+        version = self.fetch_version()
+        with self._lock:
+            if version != self.version:
+                self.clear()
+                self.version = version
+            self._checked_at = now
+        return self.version
+
+    def clear(self):
+        with self._lock:
+            self._tags.clear()
+            self._parents.clear()
+            self._children.clear()
+            self._indexes.clear()
+
+    # Lookups
+    # -------------------------------------------------------------------------
+    def get_tag(self, tag_id):
+        self.refresh()
+        tag_id = int(tag_id)
+        with self._lock:
+            tag = self._tags.get(tag_id)
+        if tag is not None:
+            return tag
+        row = db_session.query(*_TAG_COLUMNS).filter(
+            Tag.id == tag_id
+        ).first()
+        if row is None:
+            return None
+        tag = CachedTag(*row)
+        with self._lock:
+            self._tags.put(tag.id, tag)
+        return tag
+
+    def get_tags(self, tag_ids) -> dict:
+        # One version check and at most one query for any number of tags.
+        self.refresh()
+        tag_ids = set(int(tag_id) for tag_id in tag_ids)
+        tags = dict()
+        with self._lock:
+            for tag_id in tag_ids:
+                tag = self._tags.get(tag_id)
+                if tag is not None:
+                    tags[tag_id] = tag
+        missing = tag_ids.difference(tags)
+        if not missing:
+            return tags
+        rows = db_session.query(*_TAG_COLUMNS).filter(
+            Tag.id.in_(missing)
+        ).all()
+        with self._lock:
+            for row in rows:
+                tag = CachedTag(*row)
+                tags[tag.id] = tag
+                self._tags.put(tag.id, tag)
+        return tags
+
+    def get_super_tag(self, sub_id):
+        self.refresh()
+        sub_id = int(sub_id)
+        with self._lock:
+            super_tag = self._parents.get(sub_id, _MISSING)
+        if super_tag is not _MISSING:
+            return super_tag
+        row = db_session.query(*_TAG_COLUMNS).join(
+            TagSet, TagSet.super_id == Tag.id
+        ).filter(
+            TagSet.sub_id == sub_id
+        ).first()
+        super_tag = CachedTag(*row) if row is not None else None
+        with self._lock:
+            self._parents.put(sub_id, super_tag)
+            if super_tag is not None:
+                self._tags.put(super_tag.id, super_tag)
+        return super_tag
+
+    def get_tag_sets(self, super_id, sort_type):
+        if sort_type not in _SORT_COLUMNS:
+            return None
+        self.refresh()
+        return self._load_children(int(super_id)).sorted[sort_type]
+
+    def get_tag_set_page(self, super_id, sort_type, after=None, limit=40):
+        if sort_type not in _SORT_COLUMNS:
+            return None
+        self.refresh()
+        children = self._load_children(int(super_id))
+        return children.page_after(sort_type, after, limit)
+
+    def has_sub_tag(self, super_id, sub_id):
+        self.refresh()
+        return int(sub_id) in self._load_children(int(super_id)).sub_ids
+
+    def get_ngram_index(self, locale) -> NgramIndex:
+        self.refresh()
+        return self.memoize(('ngram', locale), lambda: NgramIndex(
+            self.get_active_tags(), locale + '_name'))
+
+    def get_prefix_trie(self, kind) -> PrefixTrie:
+        self.refresh()
+        return self.memoize(('trie', kind), lambda: build_prefix_trie(
+            self.get_active_tags(), kind))
+
+    def get_active_tags(self) -> [CachedTag]:
+        return self.memoize(('active_tags',), self._load_active_tags)
+
+    def memoize(self, key, build):
+        """Keep whatever build() returns until the taxonomy version changes."""
+        value = self._indexes.get(key)
+        if value is not None:
+            return value
+        with self._build_lock:
+            value = self._indexes.get(key)
+            if value is None:
+                version = self.version
+                value = build()
+                with self._lock:
+                    if version == self.version:
+                        self._indexes[key] = value
+        return value
+
+    @staticmethod
+    def _load_active_tags() -> list:
+        rows = db_session.query(*_TAG_COLUMNS).filter(
+            Tag.is_active == True
+        ).order_by(Tag.id).all()
+        return [CachedTag(*row) for row in rows]
+
+    def _load_children(self, super_id):
+        with self._lock:
+            children = self._children.get(super_id)
+        if children is not None:
+            return children
+        ranks = [func.row_number().over(order_by=(_SORT_COLUMNS[sort_type],
+                                                  TagSet.id))
+                 for sort_type in SORT_TYPES]
+        rows = db_session.query(
+            TagSet.id, TagSet.super_id, TagSet.sub_id, TagSet.priority,
+            *(_TAG_COLUMNS + tuple(ranks))
+        ).join(
+            Tag, TagSet.sub_id == Tag.id
+        ).filter(
+            TagSet.super_id == super_id,
+            TagSet.is_active == True
+        ).all()
+        tag_cols = len(_TAG_COLUMNS) + 4
+        tag_sets = [CachedTagSet(*row[:4], sub=CachedTag(*row[4:tag_cols]))
+                    for row in rows]
+        children = TagChildren(tag_sets, [row[tag_cols:] for row in rows])
+        with self._lock:
+            self._children.put(super_id, children)
+            for tag_set in tag_sets:
+                self._tags.put(tag_set.sub_id, tag_set.sub)
+        return children
+
+
+taxonomy_cache = TaxonomyCache()
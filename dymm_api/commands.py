@@ -0,0 +1,82 @@
+import click
+
+
+def register_commands(app):
+    from .helpers import Helpers
+    from .idempotency import purge_expired_keys
+    from .migrations import upgrade
+    from .migrations.explain import explain_hot_queries
+
+    @app.cli.command('upgrade-db')
+    @click.option('--dry-run', is_flag=True,
+                  help='Only list the pending migrations.')
+    def upgrade_db(dry_run):
+        """Apply pending SQL migrations in dymm_api/migrations."""
+        applied = upgrade(dry_run=dry_run)
+        if not applied:
+            click.echo('Database is up to date.')
+        for version in applied:
+            click.echo(('Pending: ' if dry_run else 'Applied: ') + version)
+
+    @app.cli.command('explain-hot-queries')
+    @click.option('--avatars', default=2000, show_default=True,
+                  help='Avatars to generate rows for.')
+    @click.option('--verbose', is_flag=True, help='Print every plan.')
+    def explain_hot_queries_command(avatars, verbose):
+        """Check that every hot query plans an index scan."""
+        failed = 0
+        for report in explain_hot_queries(avatars):
+            if report['seq_scans']:
+                failed += 1
+                click.echo('SEQ SCAN  {0}: {1}'.format(
+                    report['name'], ', '.join(report['seq_scans'])))
+            else:
+                click.echo('ok        {0}: {1}'.format(
+                    report['name'], ', '.join(report['indexes'])))
+            if verbose or report['seq_scans']:
+                click.echo(report['plan'])
+        if failed:
+            raise click.ClickException(
+                '{0} hot queries scan a whole table.'.format(failed))
+
+    @app.cli.command('reconcile-bookmarks-total')
+    def reconcile_bookmarks_total():
+        """Recount tag_bookmark_total from the active bookmarks."""
+        fixed = Helpers.reconcile_bookmarks_total()
+        click.echo('Fixed {0} bookmark totals.'.format(fixed))
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys():
+        """Delete stored Idempotency-Key responses past their TTL."""
+        purged = purge_expired_keys()
+        click.echo('Purged {0} idempotency keys.'.format(purged))
+
+    @app.cli.command('rebuild-score-rollups')
+    def rebuild_score_rollups():
+        """Recompute score_rollup from the active log groups."""
+        total = Helpers.rebuild_score_rollups()
+        click.echo('Rebuilt {0} score rollups.'.format(total))
+
+    @app.cli.command('compute-tag-impacts')
+    @click.option('--avatar-id', type=int,
+                  help='Only this avatar instead of every active one.')
+    def compute_tag_impacts(avatar_id):
+        """Recompute tag_impact from the scored log groups."""
+        if avatar_id is None:
+            avatar_ids = Helpers.get_active_avatar_ids()
+        else:
+            avatar_ids = [avatar_id]
+        total = 0
+        for active_id in avatar_ids:
+            total += Helpers.update_tag_impacts(active_id)
+        click.echo('Computed {0} tag impacts for {1} avatars.'.format(
+            total, len(avatar_ids)))
+
+    @app.cli.command('recompute-lifespans')
+    def recompute_lifespans():
+        """Refresh Avatar.full_lifespan from the trailing year of scores.
+
+        Scheduled daily in cron.yaml through /api/task/recompute-lifespans.
+        """
+        total = Helpers.update_full_lifespans()
+        click.echo('Recomputed {0} lifespans.'.format(total))
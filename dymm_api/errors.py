@@ -1,4 +1,7 @@
-from flask import jsonify
+import gzip
+
+from flask import (json, jsonify, make_response, request, Response,
+                   stream_with_context)
 
 
 def bad_req(message='Bad request'):
@@ -18,7 +21,69 @@ def forbidden(pattern=None, message='Forbidden'):
                    message=message), 403
 
 
-def ok(data=None, message='Ok'):
-    return jsonify(ok=True,
-                   message=message,
-                   data=data), 200
+def conflict(message='Conflict'):
+    return jsonify(ok=False,
+                   message=message), 409
+
+
+def ok(data=None, message='Ok', etag=None):
+    response = jsonify(ok=True,
+                       message=message,
+                       data=data)
+    if etag is not None:
+        response.set_etag(etag)
+    return response, 200
+
+
+def not_modified(etag=None):
+    response = make_response('', 304)
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def is_not_modified(etag) -> bool:
+    # Only the ETag validates: it hashes every input of the body, which no
+    # single timestamp does.
+    return bool(request.if_none_match
+                and request.if_none_match.contains_weak(etag))
+
+
+def gzip_body(data=None, message='Ok') -> bytes:
+    body = json.dumps(dict(ok=True, message=message, data=data),
+                      separators=(',', ':'), ensure_ascii=False)
+    return gzip.compress(body.encode('utf-8'))
+
+
+def ok_gzip(body: bytes, etag=None):
+    if 'gzip' in request.accept_encodings:
+        response = make_response(body)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(gzip.decompress(body))
+    response.mimetype = 'application/json'
+    response.vary.add('Accept-Encoding')
+    if etag is not None:
+        response.set_etag(etag)
+    return response, 200
+
+
+def ok_stream(items, message='Ok'):
+    """Same envelope as ok(), with data sent as a JSON array one item at a
+    time."""
+    def generate():
+        yield '{{"ok":true,"message":{0},"data":['.format(json.dumps(message))
+        for idx, item in enumerate(items):
+            yield (',' if idx else '') + json.dumps(
+                item, separators=(',', ':'), ensure_ascii=False)
+        yield ']}'
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json'), 200
+
+
+def ok_binary(body: bytes, headers=None):
+    response = make_response(body)
+    response.mimetype = 'application/octet-stream'
+    if headers:
+        response.headers.update(headers)
+    return response, 200
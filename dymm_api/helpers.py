@@ -1,17 +1,40 @@
-import os, random, re, datetime
+import os, random, re, datetime, decimal, json, base64, hashlib
 
+from flask import current_app
 from flask_jwt_extended import create_access_token, create_refresh_token
-from sqlalchemy import text, func, and_, or_
+from sqlalchemy import (text, func, and_, or_, cast, literal, literal_column,
+                        bindparam, select, tuple_, Numeric)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import joinedload
 
 from dymm_api import b_crypt, db
-from .patterns import (URIPattern, TagType, TagClass, AvatarInfo, CondLogType,
-                       BookmarkSuperTag, RegExPattern, TagId)
+from .errors import gzip_body
+from .patterns import (URIPattern, TagType, AvatarInfo, CondLogType,
+                       BookmarkSuperTag, RegExPattern, TagId, MsgPattern,
+                       PeriodType)
 from .models import (Avatar, AvatarCond, Banner, Bookmark, LogGroup, LogHistory,
-                     ProfileTag, Tag, TagLog, TagSet)
+                     ProfileTag, ScoreRollup, Tag, TagBookmarkTotal, TagImpact,
+                     TagLog, TagSet)
+from .caches import taxonomy_cache
+from .analytics import (load_tag_history, compute_tag_impacts,
+                        full_lifespan_days)
+from .indexes import (tag_search_scopes, decompose_hangul, is_hangul,
+                      is_hangul_initials)
 
 _u = URIPattern()
 _r = RegExPattern
 db_session = db.session
+_epoch = datetime.datetime(1970, 1, 1)
+TAG_FIELDS = ('id', 'tag_type', 'eng_name', 'kor_name', 'jpn_name', 'class1',
+              'division1', 'division2', 'division3', 'division4', 'division5')
+TAG_SET_FIELDS = ('id', 'super_id', 'sub_id', 'priority')
+LOG_CNT_COLUMNS = {TagType.food: 'food_cnt',
+                   TagType.activity: 'act_cnt',
+                   TagType.drug: 'drug_cnt'}
+LOG_JS_KEYS = {TagType.food: 'food_logs',
+               TagType.activity: 'act_logs',
+               TagType.drug: 'drug_logs'}
+SYNC_TABLES = ('log_groups', 'tag_logs', 'avatar_conds', 'bookmarks')
 
 
 def str_to_bool(v):
@@ -25,6 +48,119 @@ def str_to_none(v):
         return v
 
 
+def datetime_to_stamp(value: datetime.datetime) -> int:
+    # Microseconds since the epoch of a naive UTC timestamp.
+    delta = value - _epoch
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def stamp_to_datetime(stamp: int) -> datetime.datetime:
+    return _epoch + datetime.timedelta(microseconds=stamp)
+
+
+def str_to_date(v) -> datetime.date:
+    return datetime.datetime.strptime(v, '%Y-%m-%d').date()
+
+
+def make_etag(*parts) -> str:
+    raw = json.dumps(parts, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+
+def taxonomy_version(stamp, tag_total, tag_set_total) -> str:
+    # Row counts go with the latest change, a removed row changes no
+    # timestamp.
+    return '{0}.{1}.{2}'.format(stamp, tag_total, tag_set_total)
+
+
+def parse_taxonomy_version(version: str) -> [int]:
+    parts = str(version).split('.')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        raise ValueError('Invalid taxonomy version')
+    return [int(part) for part in parts]
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(values, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def note_tsquery(keyword: str):
+    """Prefix tsquery over the words of keyword, or None if it has none.
+
+    Notes are indexed with the 'simple' configuration, which keeps Korean
+    words whole, so prefixes let 김치 match 김치를 and 김치찌개.
+    """
+    words = re.findall(r'\w+', keyword.lower())[:8]
+    if not words:
+        return None
+    return ' & '.join("'{0}':*".format(word) for word in words)
+
+
+def score_periods(log_group) -> [tuple]:
+    # (period_type, year_number, period_number) of every score_rollup row a
+    # log group counts towards.
+    return [(PeriodType.day, log_group.year_number, log_group.day_of_year),
+            (PeriodType.week, log_group.year_number, log_group.week_of_year),
+            (PeriodType.month, log_group.year_number, log_group.month_number),
+            (PeriodType.year, log_group.year_number, 0)]
+
+
+def avg_rollup_score():
+    # Same value and scale as avg(cond_score) over the raw rows.
+    return (cast(func.sum(ScoreRollup.score_sum), Numeric)
+            / func.nullif(func.sum(ScoreRollup.score_cnt), 0)
+            ).label('avg_score')
+
+
+def previous_period(period_type, year_number, period_number) -> tuple:
+    if period_type == PeriodType.year:
+        return year_number - 1, 0
+    if period_number > 1:
+        return year_number, period_number - 1
+    if period_type == PeriodType.month:
+        return year_number - 1, 12
+    # ISO years have 52 or 53 weeks; Dec 28th always falls in the last one.
+    last_week = datetime.date(year_number - 1, 12, 28).isocalendar()[1]
+    return year_number - 1, last_week
+
+
+def period_keys(period_type, year_number, period_number, count) -> [tuple]:
+    # (year_number, period_number) of count periods, oldest first, ending
+    # with the given one.
+    keys = [(year_number, period_number)]
+    while len(keys) < count:
+        keys.append(previous_period(period_type, *keys[-1]))
+    return keys[::-1]
+
+
+def upsert_log_groups(values):
+    """INSERT log_group rows, adding the counts into the active group with
+    the same (avatar_id, log_date, group_type) when there is one."""
+    log_group = LogGroup.__table__
+    stmt = pg_insert(log_group).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[log_group.c.avatar_id, log_group.c.log_date,
+                        log_group.c.group_type],
+        index_where=log_group.c.is_active == True,
+        set_=dict(food_cnt=log_group.c.food_cnt + stmt.excluded.food_cnt,
+                  act_cnt=log_group.c.act_cnt + stmt.excluded.act_cnt,
+                  drug_cnt=log_group.c.drug_cnt + stmt.excluded.drug_cnt,
+                  modified_timestamp=text("timezone('utc'::text, now())"))
+    )
+
+
 class Helpers(object):
     # Generators
     # -------------------------------------------------------------------------
@@ -48,13 +184,8 @@ class Helpers(object):
         return False
 
     @staticmethod
-    def is_x_super_got_y_sub(super_id, sub_id):
-        tag_set = TagSet.query.filter(
-            TagSet.super_id == super_id,
-            TagSet.sub_id == sub_id,
-            TagSet.is_active == True
-        ).first()
-        return tag_set
+    def is_x_super_got_y_sub(super_id, sub_id) -> bool:
+        return taxonomy_cache.has_sub_tag(super_id, sub_id)
 
     @staticmethod
     def has_bookmark(avatar_id, tag_id) -> bool:
@@ -176,6 +307,105 @@ class Helpers(object):
             _js_list.append(_js)
         return _js_list
 
+    @staticmethod
+    def convert_groups_of_logs_into_js(rows) -> [dict]:
+        # rows come from get_groups_of_logs, ordered by group.
+        _js_by_group = dict()
+        for row in rows:
+            _js = _js_by_group.get(row.group_id)
+            if _js is None:
+                _js = _js_by_group[row.group_id] = dict(group_id=row.group_id)
+                if row.cond_score is not None:
+                    _js['cond_score'] = row.cond_score
+            key = LOG_JS_KEYS.get(row.tag_type)
+            if row.id is None or key is None:
+                continue
+            _js.setdefault(key, list()).append(dict(
+                id=row.id,
+                group_id=row.group_id,
+                tag_id=row.tag_id,
+                x_val=row.x_val,
+                y_val=row.y_val,
+                eng_name=row.eng_name,
+                kor_name=row.kor_name,
+                jpn_name=row.jpn_name
+            ))
+        return list(_js_by_group.values())
+
+    @staticmethod
+    def convert_calendar_into_js(log_groups: [LogGroup], rows):
+        logs_by_group = {_js['group_id']: _js for _js in
+                         Helpers.convert_groups_of_logs_into_js(rows)}
+        for _js in Helpers.convert_log_groups_into_js(log_groups):
+            logs_js = logs_by_group.get(_js['id'], dict())
+            for key in LOG_JS_KEYS.values():
+                _js[key] = logs_js.get(key, list())
+            yield _js
+
+    @staticmethod
+    def convert_sync_changes_into_js(changes: dict) -> dict:
+        converters = dict(
+            log_groups=Helpers.convert_log_groups_into_js,
+            tag_logs=Helpers.convert_tag_logs_into_js,
+            avatar_conds=Helpers.convert_avt_cond_list_into_js,
+            bookmarks=Helpers.convert_bookmarks_into_js
+        )
+        _js = dict()
+        for name in SYNC_TABLES:
+            rows = changes[name]
+            _js_list = converters[name](rows)
+            for row, row_js in zip(rows, _js_list):
+                row_js['is_active'] = row.is_active
+            _js[name] = _js_list
+        return _js
+
+    @staticmethod
+    def convert_note_hits_into_js(rows) -> [dict]:
+        _js_list = Helpers.convert_log_groups_into_js(
+            [row.LogGroup for row in rows])
+        for row, _js in zip(rows, _js_list):
+            _js['rank'] = float(row.rank)
+            _js['headline'] = row.headline
+        return _js_list
+
+    @staticmethod
+    def convert_score_series_into_js(series: [tuple]) -> [dict]:
+        # The first period of series only serves the delta of the second.
+        _js_list = list()
+        for (_, _, last_avg), (year_number, period_number, avg_score) in zip(
+                series, series[1:]):
+            delta = None
+            if avg_score is not None and last_avg is not None:
+                delta = round(float(avg_score - last_avg), 3)
+            _js_list.append(dict(
+                year_number=year_number,
+                period_number=period_number,
+                avg_score=(round(float(avg_score), 3)
+                           if avg_score is not None else None),
+                delta=delta
+            ))
+        return _js_list
+
+    @staticmethod
+    def convert_tag_impacts_into_js(rows) -> [dict]:
+        _js_list = list()
+        for tag_impact, tag in rows:
+            _js = dict(tag_id=tag.id,
+                       tag_type=tag.tag_type,
+                       eng_name=tag.eng_name,
+                       kor_name=tag.kor_name,
+                       jpn_name=tag.jpn_name,
+                       group_cnt=tag_impact.group_cnt,
+                       lag_cnt=tag_impact.lag_cnt,
+                       avg_with=tag_impact.avg_with,
+                       avg_without=tag_impact.avg_without,
+                       score_diff=tag_impact.score_diff,
+                       lag_diff=tag_impact.lag_diff,
+                       ci_low=tag_impact.ci_low,
+                       ci_high=tag_impact.ci_high)
+            _js_list.append(_js)
+        return _js_list
+
     @staticmethod
     def convert_a_tag_into_js(tag: Tag) -> dict:
         _js = dict(id=tag.id,
@@ -240,6 +470,26 @@ class Helpers(object):
             _js_list.append(_js)
         return _js_list, _matching_idx
 
+    @staticmethod
+    def convert_taxonomy_into_js(version, tags, tag_sets,
+                                 with_is_active=False) -> dict:
+        tag_fields = TAG_FIELDS + (('is_active',) if with_is_active else ())
+        set_fields = TAG_SET_FIELDS + (('is_active',) if with_is_active
+                                       else ())
+        _js = dict(
+            version=version,
+            tags=dict(
+                fields=tag_fields,
+                rows=[[getattr(tag, f) for f in tag_fields] for tag in tags]
+            ),
+            tag_sets=dict(
+                fields=set_fields,
+                rows=[[getattr(tag_set, f) for f in set_fields]
+                      for tag_set in tag_sets]
+            )
+        )
+        return _js
+
     @staticmethod
     def convert_profile_tag_into_js(profile_tags: [ProfileTag]):
         _js_list = list()
@@ -346,152 +596,69 @@ class Helpers(object):
         return banners
 
     @staticmethod
-    def get_a_tag(tag_id):
-        tag = Tag.query.filter(
-            Tag.id == tag_id
+    def get_banners_version():
+        # Deactivated rows count towards the latest change, so removing the
+        # newest banner still moves the version forward.
+        version = db_session.query(
+            func.max(func.coalesce(Banner.modified_timestamp,
+                                   Banner.created_timestamp)),
+            func.count(Banner.id).filter(Banner.is_active == True)
         ).first()
+        return version
+
+    @staticmethod
+    def get_a_tag(tag_id):
+        tag = taxonomy_cache.get_tag(tag_id)
         return tag
 
+    @staticmethod
+    def get_tags(tag_ids) -> dict:
+        tags = taxonomy_cache.get_tags(tag_ids)
+        return tags
+
     @staticmethod
     def get_a_super_tag(sub_id):
-        tag_set = TagSet.query.filter(
-            TagSet.sub_id == sub_id
-        ).first()
-        return tag_set.super
+        super_tag = taxonomy_cache.get_super_tag(sub_id)
+        return super_tag
 
     @staticmethod
     def search_low_div_tags_from_up_div_tag(super_tag: Tag, keyword: str,
                                             page=None, per_page=40):
-        tag_name = Tag.eng_name
+        locale = 'eng'
         _reg_obj = re.compile(_r.kor_name)
-        if _reg_obj.match(keyword[0]):
-            tag_name = Tag.kor_name
-        if super_tag.division1 == 0:
-            if super_tag.class1 == TagClass.drug:
-                drug_tags = Tag.query.filter(
-                    Tag.class1 == TagClass.drug_abc,
-                    Tag.division1 != 0,
-                    Tag.division2 != 0,
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, (per_page / 2), False).items
-                supp_tags = Tag.query.filter(
-                    Tag.class1 == TagClass.food,
-                    Tag.division1 == 20,  # 20: Supplements
-                    Tag.division2 != 0,
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, (per_page / 2), False).items
-                # supp_tags.extend(drug_tags)
-                drug_tags.extend(supp_tags)
-                return drug_tags
-            if super_tag.class1 == TagClass.food:
-                tags = Tag.query.filter(
-                    Tag.class1 == super_tag.class1,
-                    Tag.division1 != 0,
-                    Tag.division1 != 20,  # 20: Supplements
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, per_page, False).items
-                return tags
-            if super_tag.class1 == TagClass.cond:
-                cond_tags = Tag.query.filter(
-                    Tag.class1 == super_tag.class1,
-                    Tag.division1 != 0,
-                    Tag.division4 == 0,
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, per_page, False).items
-                return cond_tags
-            tags = Tag.query.filter(
-                Tag.class1 == super_tag.class1,
-                Tag.division1 != 0,
-                func.lower(tag_name).contains(keyword.lower(),
-                                              autoescape=True),
-                Tag.is_active == True
-            ).paginate(page, per_page, False).items
-        elif super_tag.division2 == 0:
-            if super_tag.class1 == TagClass.drug:
-                # TODO: - Need to adjust TagSet
-                drug_tags = Tag.query.filter(
-                    Tag.class1 == TagClass.drug_abc,
-                    Tag.division1 != 0,
-                    Tag.division2 != 0,
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, per_page, False).items
-                return drug_tags
-            if super_tag.class1 == TagClass.cond:
-                cond_tags = Tag.query.filter(
-                    Tag.class1 == super_tag.class1,
-                    Tag.division1 == super_tag.division1,
-                    Tag.division2 != 0,
-                    Tag.division4 == 0,
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, per_page, False).items
-                return cond_tags
-            tags = Tag.query.filter(
-                Tag.class1 == super_tag.class1,
-                Tag.division1 == super_tag.division1,
-                Tag.division2 != 0,
-                func.lower(tag_name).contains(keyword.lower(),
-                                              autoescape=True),
-                Tag.is_active == True
-            ).paginate(page, per_page, False).items
-        elif super_tag.division3 == 0:
-            if super_tag.class1 == TagClass.cond:
-                cond_tags = Tag.query.filter(
-                    Tag.class1 == super_tag.class1,
-                    Tag.division1 == super_tag.division1,
-                    Tag.division2 == super_tag.division2,
-                    Tag.division3 != 0,
-                    Tag.division4 == 0,
-                    func.lower(tag_name).contains(keyword.lower(),
-                                                  autoescape=True),
-                    Tag.is_active == True
-                ).paginate(page, per_page, False).items
-                return cond_tags
-            tags = Tag.query.filter(
-                Tag.class1 == super_tag.class1,
-                Tag.division1 == super_tag.division1,
-                Tag.division2 == super_tag.division2,
-                Tag.division3 != 0,
-                func.lower(tag_name).contains(keyword.lower(),
-                                              autoescape=True),
-                Tag.is_active == True
-            ).paginate(page, per_page, False).items
-        elif super_tag.division4 == 0:
-            tags = Tag.query.filter(
-                Tag.class1 == super_tag.class1,
-                Tag.division1 == super_tag.division1,
-                Tag.division2 == super_tag.division2,
-                Tag.division3 == super_tag.division3,
-                Tag.division4 != 0,
-                func.lower(tag_name).contains(keyword.lower(),
-                                              autoescape=True),
-                Tag.is_active == True
-            ).paginate(page, per_page, False).items
-        elif super_tag.division5 == 0:
-            tags = Tag.query.filter(
-                Tag.class1 == super_tag.class1,
-                Tag.division1 == super_tag.division1,
-                Tag.division2 == super_tag.division2,
-                Tag.division3 == super_tag.division3,
-                Tag.division4 == super_tag.division4,
-                Tag.division5 != 0,
-                func.lower(tag_name).contains(keyword.lower(),
-                                              autoescape=True),
-                Tag.is_active == True
-            ).paginate(page, per_page, False).items
-        else:
+        if keyword and _reg_obj.match(keyword[0]):
+            locale = 'kor'
+        scopes = tag_search_scopes(super_tag)
+        if scopes is False:
             return False
+        index = taxonomy_cache.get_ngram_index(locale)
+        tags = index.search_page(keyword, scopes, page, per_page)
+        return tags
+
+    @staticmethod
+    def autocomplete_tags(super_tag: Tag, keyword: str, locale=None,
+                          limit=10):
+        scopes = tag_search_scopes(super_tag)
+        if scopes is False:
+            return False
+        keyword = keyword.strip().lower()
+        if not keyword:
+            return list()
+        if locale is None:
+            locale = 'kor' if is_hangul(keyword[0]) else 'eng'
+        if locale == 'kor':
+            if is_hangul_initials(keyword):
+                kind = 'kor_initials'
+                keyword = ''.join(keyword.split())
+            else:
+                kind = 'kor'
+                keyword = decompose_hangul(keyword)
+        else:
+            kind = locale
+        trie = taxonomy_cache.get_prefix_trie(kind)
+        tags = trie.complete(keyword,
+                             lambda t: any(scope(t) for scope in scopes),
+                             limit)
         return tags
 
     @staticmethod
@@ -508,6 +675,13 @@ class Helpers(object):
         ).first()
         return avatar
 
+    @staticmethod
+    def get_active_avatar_ids() -> [int]:
+        rows = db_session.query(Avatar.id).filter(
+            Avatar.is_active == True
+        ).order_by(Avatar.id).all()
+        return [row.id for row in rows]
+
     @staticmethod
     def get_a_avatar_cond(avatar_cond_id):
         avt_cond = AvatarCond.query.filter(
@@ -518,7 +692,9 @@ class Helpers(object):
 
     @staticmethod
     def get_avt_cond_list(avatar_id):
-        avt_cond_list = AvatarCond.query.filter(
+        avt_cond_list = AvatarCond.query.options(
+            joinedload(AvatarCond.tag)
+        ).filter(
             AvatarCond.avatar_id == avatar_id,
             AvatarCond.is_active == True
         ).order_by(
@@ -527,6 +703,17 @@ class Helpers(object):
         ).all()
         return avt_cond_list
 
+    @staticmethod
+    def get_avt_cond_list_version(avatar_id):
+        version = db_session.query(
+            func.max(func.coalesce(AvatarCond.modified_timestamp,
+                                   AvatarCond.created_timestamp)),
+            func.count(AvatarCond.id).filter(AvatarCond.is_active == True)
+        ).filter(
+            AvatarCond.avatar_id == avatar_id
+        ).first()
+        return version
+
     @staticmethod
     def get_a_log_group(group_id) -> LogGroup:
         log_group = LogGroup.query.filter(
@@ -573,50 +760,225 @@ class Helpers(object):
         return log_groups
 
     @staticmethod
-    def get_avg_score_per_month(avatar_id, year_number, month_number):
-        avg_score = LogGroup.query.with_entities(
-            func.avg(LogGroup.cond_score).label('avg_score')
+    def get_log_group_note_page(avatar_id, cursor=None, per_page=20):
+        # Newest first, keyed on (log_date, group_type, id) so every page
+        # is one range scan of ix_log_group_avatar_note. Legacy groups
+        # without a log_date cannot be placed on that key and are left out.
+        query = LogGroup.query.filter(
+            LogGroup.avatar_id == avatar_id,
+            LogGroup.note != None,
+            LogGroup.is_active == True,
+            LogGroup.log_date != None
+        )
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 4 or values[0] != 'note':
+                raise ValueError('Invalid cursor')
+            after = (str_to_date(values[1]), int(values[2]), int(values[3]))
+            query = query.filter(
+                tuple_(LogGroup.log_date, LogGroup.group_type, LogGroup.id)
+                < tuple_(*after)
+            )
+        log_groups = query.order_by(
+            LogGroup.log_date.desc(),
+            LogGroup.group_type.desc(),
+            LogGroup.id.desc()
+        ).limit(per_page + 1).all()
+        next_cursor = None
+        if len(log_groups) > per_page:
+            log_groups = log_groups[:per_page]
+            last = log_groups[-1]
+            next_cursor = encode_cursor('note', last.log_date.isoformat(),
+                                        last.group_type, last.id)
+        return log_groups, next_cursor
+
+    @staticmethod
+    def search_log_group_notes(avatar_id, keyword, cursor=None, per_page=20):
+        # Best match first, keyed on (rank, id). Matching goes through the
+        # ix_log_group_note_fts GIN index, ranking only sees the avatar's
+        # matches.
+        tsquery = note_tsquery(keyword)
+        if tsquery is None:
+            raise ValueError('Empty keyword')
+        config = literal_column("'simple'")
+        document = func.to_tsvector(config, LogGroup.note)
+        query_ts = func.to_tsquery(config, tsquery)
+        # ts_rank is a real; comparing it with a float from the cursor widens
+        # it to float8 and no row equals the cursor any more. A rounded
+        # numeric survives the round trip through the cursor exactly.
+        rank = func.round(cast(func.ts_rank(document, query_ts), Numeric), 6)
+        query = db_session.query(
+            LogGroup,
+            rank.label('rank'),
+            func.ts_headline(config, LogGroup.note, query_ts,
+                             'MaxWords=20, MinWords=5').label('headline')
         ).filter(
             LogGroup.avatar_id == avatar_id,
-            LogGroup.year_number == year_number,
-            LogGroup.month_number == month_number,
-            LogGroup.is_active == True
+            LogGroup.note != None,
+            LogGroup.is_active == True,
+            document.op('@@')(query_ts)
+        )
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 4 or values[0] != 'note-search' \
+                    or values[1] != tsquery:
+                raise ValueError('Invalid cursor')
+            try:
+                after_rank = decimal.Decimal(values[2])
+            except (TypeError, decimal.InvalidOperation):
+                raise ValueError('Invalid cursor')
+            after_id = int(values[3])
+            query = query.filter(or_(
+                rank < after_rank,
+                and_(rank == after_rank, LogGroup.id < after_id)
+            ))
+        rows = query.order_by(
+            rank.desc(),
+            LogGroup.id.desc()
+        ).limit(per_page + 1).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            last = rows[-1]
+            next_cursor = encode_cursor('note-search', tsquery, str(last.rank),
+                                        last.LogGroup.id)
+        return rows, next_cursor
+
+    @staticmethod
+    def get_avg_score_per_month(avatar_id, year_number, month_number):
+        avg_score = db_session.query(avg_rollup_score()).filter(
+            ScoreRollup.avatar_id == avatar_id,
+            ScoreRollup.period_type == PeriodType.month,
+            ScoreRollup.year_number == year_number,
+            ScoreRollup.period_number == month_number
         ).first()
         return avg_score
 
     @staticmethod
     def get_avg_score_per_week(avatar_id, year_number, week_of_year):
-        avg_score = LogGroup.query.with_entities(
-            func.avg(LogGroup.cond_score).label('avg_score')
-        ).filter(
-            LogGroup.avatar_id == avatar_id,
-            LogGroup.year_number == year_number,
-            LogGroup.week_of_year == week_of_year,
-            LogGroup.is_active == True
+        avg_score = db_session.query(avg_rollup_score()).filter(
+            ScoreRollup.avatar_id == avatar_id,
+            ScoreRollup.period_type == PeriodType.week,
+            ScoreRollup.year_number == year_number,
+            ScoreRollup.period_number == week_of_year
         ).first()
         return avg_score
 
     @staticmethod
     def get_avg_score_per_year(avatar_id, year_number):
-        avg_score = LogGroup.query.with_entities(
-            func.avg(LogGroup.cond_score).label('avg_score')
-        ).filter(
-            LogGroup.avatar_id == avatar_id,
-            LogGroup.year_number == year_number,
-            LogGroup.is_active == True
+        avg_score = db_session.query(avg_rollup_score()).filter(
+            ScoreRollup.avatar_id == avatar_id,
+            ScoreRollup.period_type == PeriodType.year,
+            ScoreRollup.year_number == year_number,
+            ScoreRollup.period_number == 0
         ).first()
         return avg_score
 
     @staticmethod
     def get_avg_score_between_dates(avatar_id, start_date, end_date):
-        avg_score = LogGroup.query.with_entities(
-            func.avg(LogGroup.cond_score).label('avg_score')
+        start = str_to_date(start_date)
+        end = str_to_date(end_date)
+        day = tuple_(ScoreRollup.year_number, ScoreRollup.period_number)
+        avg_score = db_session.query(avg_rollup_score()).filter(
+            ScoreRollup.avatar_id == avatar_id,
+            ScoreRollup.period_type == PeriodType.day,
+            day >= tuple_(start.year, start.timetuple().tm_yday),
+            day <= tuple_(end.year, end.timetuple().tm_yday)
+        ).first()
+        return avg_score
+
+    @staticmethod
+    def get_avg_scores_between_dates(start_date, end_date) -> list:
+        # Same window as get_avg_score_between_dates, every active avatar
+        # with a score in one grouped query.
+        start = str_to_date(start_date)
+        end = str_to_date(end_date)
+        day = tuple_(ScoreRollup.year_number, ScoreRollup.period_number)
+        rows = db_session.query(
+            ScoreRollup.avatar_id,
+            avg_rollup_score()
+        ).join(
+            Avatar, Avatar.id == ScoreRollup.avatar_id
+        ).filter(
+            Avatar.is_active == True,
+            ScoreRollup.period_type == PeriodType.day,
+            day >= tuple_(start.year, start.timetuple().tm_yday),
+            day <= tuple_(end.year, end.timetuple().tm_yday)
+        ).group_by(
+            ScoreRollup.avatar_id
+        ).having(
+            func.sum(ScoreRollup.score_cnt) > 0
+        ).all()
+        return rows
+
+    @staticmethod
+    def get_daily_scores(avatar_id, year_number) -> list:
+        rows = db_session.query(
+            ScoreRollup.period_number,
+            ScoreRollup.score_sum,
+            ScoreRollup.score_cnt
+        ).filter(
+            ScoreRollup.avatar_id == avatar_id,
+            ScoreRollup.period_type == PeriodType.day,
+            ScoreRollup.year_number == year_number
+        ).all()
+        return rows
+
+    @staticmethod
+    def get_score_series(avatar_id, period_type, year_number, period_number,
+                         count) -> [tuple]:
+        """(year_number, period_number, avg_score) of count periods ending
+        with the given one, oldest first; avg_score is None when nothing
+        was scored. One primary key lookup per period, in one query."""
+        keys = period_keys(period_type, year_number, period_number, count)
+        rows = db_session.query(
+            ScoreRollup.year_number,
+            ScoreRollup.period_number,
+            (cast(ScoreRollup.score_sum, Numeric)
+             / func.nullif(ScoreRollup.score_cnt, 0)).label('avg_score')
+        ).filter(
+            ScoreRollup.avatar_id == avatar_id,
+            ScoreRollup.period_type == period_type,
+            tuple_(ScoreRollup.year_number,
+                   ScoreRollup.period_number).in_(keys)
+        ).all()
+        avg_scores = {(row.year_number, row.period_number): row.avg_score
+                      for row in rows}
+        return [key + (avg_scores.get(key),) for key in keys]
+
+    @staticmethod
+    def get_tag_impact_history(avatar_id) -> list:
+        rows = db_session.query(
+            LogGroup.id,
+            LogGroup.log_date,
+            LogGroup.cond_score,
+            TagLog.tag_id
+        ).outerjoin(
+            TagLog, and_(TagLog.group_id == LogGroup.id,
+                         TagLog.is_active == True)
         ).filter(
             LogGroup.avatar_id == avatar_id,
             LogGroup.is_active == True,
-            LogGroup.log_date.between(start_date, end_date)
-        ).first()
-        return avg_score
+            LogGroup.cond_score != None,
+            LogGroup.log_date != None
+        ).order_by(
+            LogGroup.log_date,
+            LogGroup.group_type,
+            LogGroup.id
+        ).all()
+        return rows
+
+    @staticmethod
+    def get_tag_impacts(avatar_id) -> list:
+        rows = db_session.query(TagImpact, Tag).join(
+            Tag, TagImpact.tag_id == Tag.id
+        ).filter(
+            TagImpact.avatar_id == avatar_id
+        ).order_by(
+            TagImpact.score_diff.desc().nullslast(),
+            TagImpact.tag_id
+        ).all()
+        return rows
 
     @staticmethod
     def get_remaining_life_span(score: int):
@@ -653,85 +1015,207 @@ class Helpers(object):
         return r_span_day
 
     @staticmethod
-    def get_tag_logs(group_id, tag_type) -> [TagLog]:
-        tag_logs = db_session.query(
-            TagLog
-        ).join(
-            TagLog.tag
+    def get_groups_of_logs(group_ids) -> list:
+        # One row per active tag log with its tag, and a row with empty log
+        # columns for a group without any.
+        rows = db_session.query(
+            LogGroup.id.label('group_id'),
+            LogGroup.cond_score,
+            TagLog.id,
+            TagLog.tag_id,
+            TagLog.x_val,
+            TagLog.y_val,
+            Tag.tag_type,
+            Tag.eng_name,
+            Tag.kor_name,
+            Tag.jpn_name
+        ).outerjoin(
+            TagLog, and_(TagLog.group_id == LogGroup.id,
+                         TagLog.is_active == True)
+        ).outerjoin(
+            Tag, Tag.id == TagLog.tag_id
         ).filter(
-            TagLog.group_id == group_id,
-            TagLog.is_active == True,
-            Tag.tag_type == tag_type
-        ).order_by(Tag.division1).all()
-        return tag_logs
+            LogGroup.id.in_(group_ids),
+            LogGroup.is_active == True
+        ).order_by(
+            LogGroup.id,
+            Tag.division1,
+            TagLog.id
+        ).all()
+        return rows
+
+    @staticmethod
+    def get_sync_changes(avatar_id, cursor=None, per_page=200):
+        """Rows of the avatar created, modified or deactivated since cursor.
+
+        The cursor holds a (changed_at, id) watermark per table and every
+        table is read in that order. Changes younger than SYNC_LAG seconds
+        wait for the next call, so a transaction that commits late with an
+        older timestamp is not skipped.
+        """
+        after = [None] * len(SYNC_TABLES)
+        if cursor:
+            values = decode_cursor(cursor)
+            if (len(values) != 2 * len(SYNC_TABLES) + 1
+                    or values[0] != 'sync'):
+                raise ValueError('Invalid cursor')
+            for idx in range(len(SYNC_TABLES)):
+                stamp, row_id = values[2 * idx + 1:2 * idx + 3]
+                if stamp is not None:
+                    after[idx] = (stamp_to_datetime(int(stamp)), int(row_id))
+        lag = current_app.config.get('SYNC_LAG', 5)
+        until = (func.timezone('utc', func.now())
+                 - datetime.timedelta(seconds=lag))
+
+        def changed_since(query, model, created, idx):
+            changed_at = func.coalesce(model.modified_timestamp, created)
+            query = query.add_columns(changed_at).filter(changed_at <= until)
+            if after[idx] is not None:
+                query = query.filter(
+                    tuple_(changed_at, model.id) > tuple_(*after[idx]))
+            return query.order_by(changed_at, model.id).limit(per_page + 1)
+
+        queries = (
+            changed_since(LogGroup.query.filter(
+                LogGroup.avatar_id == avatar_id
+            ), LogGroup, LogGroup.created_timestamp, 0),
+            changed_since(TagLog.query.join(
+                LogGroup, LogGroup.id == TagLog.group_id
+            ).options(
+                joinedload(TagLog.tag)
+            ).filter(
+                LogGroup.avatar_id == avatar_id
+            ), TagLog, TagLog.create_timestamp, 1),
+            changed_since(AvatarCond.query.options(
+                joinedload(AvatarCond.tag)
+            ).filter(
+                AvatarCond.avatar_id == avatar_id
+            ), AvatarCond, AvatarCond.created_timestamp, 2),
+            changed_since(Bookmark.query.options(
+                joinedload(Bookmark.sub_tag)
+            ).filter(
+                Bookmark.avatar_id == avatar_id
+            ), Bookmark, Bookmark.created_timestamp, 3)
+        )
+        changes = dict()
+        watermarks = ['sync']
+        has_more = False
+        for idx, query in enumerate(queries):
+            rows = query.all()
+            if len(rows) > per_page:
+                has_more = True
+                rows = rows[:per_page]
+            if rows:
+                row, changed_at = rows[-1]
+                watermarks.extend([datetime_to_stamp(changed_at), row.id])
+            elif after[idx] is not None:
+                watermarks.extend([datetime_to_stamp(after[idx][0]),
+                                   after[idx][1]])
+            else:
+                watermarks.extend([None, None])
+            changes[SYNC_TABLES[idx]] = [row for row, _ in rows]
+        return changes, encode_cursor(*watermarks), has_more
 
     @staticmethod
     def get_tag_sets(super_id: int, sort_type, page=None, per_page=40):
-        if sort_type == 'eng':
-            if page:
-                tag_sets = TagSet.query.join(TagSet.sub).filter(
-                    TagSet.super_id == super_id,
-                    TagSet.is_active == True
-                ).order_by(
-                    Tag.eng_name
-                ).paginate(page, per_page, False).items
-                return tag_sets
-            tag_sets = db_session.query(TagSet).join(TagSet.sub).filter(
-                TagSet.super_id == super_id,
-                TagSet.is_active == True
-            ).order_by(Tag.eng_name).all()
-        elif sort_type == 'kor':
-            if page:
-                tag_sets = TagSet.query.join(TagSet.sub).filter(
-                    TagSet.super_id == super_id,
-                    TagSet.is_active == True
-                ).order_by(
-                    Tag.kor_name
-                ).paginate(page, per_page, False).items
-                return tag_sets
-            tag_sets = db_session.query(TagSet).join(TagSet.sub).filter(
-                TagSet.super_id == super_id,
-                TagSet.is_active == True
-            ).order_by(Tag.kor_name).all()
-        elif sort_type == 'jpn':
-            if page:
-                tag_sets = TagSet.query.join(TagSet.sub).filter(
-                    TagSet.super_id == super_id,
-                    TagSet.is_active == True
-                ).order_by(
-                    Tag.jpn_name
-                ).paginate(page, per_page, False).items
-                return tag_sets
-            tag_sets = db_session.query(TagSet).join(TagSet.sub).filter(
-                TagSet.super_id == super_id,
-                TagSet.is_active == True
-            ).order_by(Tag.jpn_name).all()
-        elif sort_type == 'priority':
-            if page:
-                tag_sets = db_session.query(TagSet).filter(
-                    TagSet.super_id == super_id,
-                    TagSet.is_active == True
-                ).order_by(
-                    TagSet.priority.desc()
-                ).paginate(page, per_page, False).items
-                return tag_sets
-            tag_sets = db_session.query(TagSet).filter(
-                TagSet.super_id == super_id,
-                TagSet.is_active == True
-            ).order_by(TagSet.priority.desc()).all()
-        else:
+        tag_sets = taxonomy_cache.get_tag_sets(super_id, sort_type)
+        if tag_sets is None:
             return False
+        if page:
+            start = (max(page, 1) - 1) * per_page
+            return tag_sets[start:start + per_page]
         return tag_sets
 
+    @staticmethod
+    def get_tag_set_page(super_id: int, sort_type, cursor=None, per_page=40):
+        after = None
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 3 or values[0] != sort_type:
+                raise ValueError('Invalid cursor')
+            after = (int(values[1]), int(values[2]))
+        page = taxonomy_cache.get_tag_set_page(super_id, sort_type, after,
+                                               per_page)
+        if page is None:
+            return False, None
+        tag_sets, start, has_more = page
+        next_cursor = None
+        if has_more and tag_sets:
+            next_cursor = encode_cursor(sort_type, tag_sets[-1].sub_id,
+                                        start + len(tag_sets) - 1)
+        return tag_sets, next_cursor
+
+    @staticmethod
+    def get_taxonomy_version() -> str:
+        version = taxonomy_cache.refresh()
+        stamps = [ts for ts in (version[0], version[2]) if ts is not None]
+        stamp = datetime_to_stamp(max(stamps)) if stamps else 0
+        return taxonomy_version(stamp, version[1], version[3])
+
+    @staticmethod
+    def get_taxonomy_snapshot():
+        version = Helpers.get_taxonomy_version()
+
+        def build():
+            tag_sets = db_session.query(
+                *[getattr(TagSet, f) for f in TAG_SET_FIELDS]
+            ).filter(
+                TagSet.is_active == True
+            ).order_by(TagSet.id).all()
+            return gzip_body(Helpers.convert_taxonomy_into_js(
+                version, taxonomy_cache.get_active_tags(), tag_sets))
+        return version, taxonomy_cache.memoize(('snapshot',), build)
+
+    @staticmethod
+    def get_taxonomy_delta(since: str) -> dict:
+        # Read the version first, a row committed while the delta is read
+        # is then sent again next time rather than skipped.
+        version = Helpers.get_taxonomy_version()
+        stamp, tag_total, tag_set_total = parse_taxonomy_version(since)
+        since = stamp_to_datetime(stamp)
+        # Removed rows leave nothing to send. When the totals are not the
+        # old ones plus the rows created since, some were removed and the
+        # client has to take a new snapshot.
+        created = db_session.query(
+            db_session.query(func.count(Tag.id)).filter(
+                Tag.created_timestamp > since).as_scalar(),
+            db_session.query(func.count(TagSet.id)).filter(
+                TagSet.created_timestamp > since).as_scalar()
+        ).first()
+        _, current_tags, current_tag_sets = parse_taxonomy_version(version)
+        if (current_tags != tag_total + created[0]
+                or current_tag_sets != tag_set_total + created[1]):
+            return dict(Helpers.convert_taxonomy_into_js(
+                version, [], [], with_is_active=True), reset=True)
+        tags = db_session.query(
+            *[getattr(Tag, f) for f in TAG_FIELDS + ('is_active',)]
+        ).filter(
+            func.coalesce(Tag.modified_timestamp,
+                          Tag.created_timestamp) > since
+        ).order_by(Tag.id).all()
+        tag_sets = db_session.query(
+            *[getattr(TagSet, f) for f in TAG_SET_FIELDS + ('is_active',)]
+        ).filter(
+            func.coalesce(TagSet.modified_timestamp,
+                          TagSet.created_timestamp) > since
+        ).order_by(TagSet.id).all()
+        return dict(Helpers.convert_taxonomy_into_js(
+            version, tags, tag_sets, with_is_active=True), reset=False)
+
     @staticmethod
     def get_valid_profile_tags(avatar_id, tag_sets):
         profile_tags = list()
+        existing = dict()
+        for profile_tag in ProfileTag.query.options(
+            joinedload(ProfileTag.sub_tag)
+        ).filter(
+            ProfileTag.avatar_id == avatar_id,
+            ProfileTag.super_tag_id.in_([t.sub_id for t in tag_sets]),
+            ProfileTag.is_active == True
+        ).order_by(ProfileTag.id).all():
+            existing.setdefault(profile_tag.super_tag_id, profile_tag)
         for tag_set in tag_sets:
-            profile_tag = ProfileTag.query.filter(
-                ProfileTag.avatar_id == avatar_id,
-                ProfileTag.super_tag_id == tag_set.sub_id,
-                ProfileTag.is_active == True
-            ).first()
+            profile_tag = existing.get(tag_set.sub_id)
             if profile_tag:
                 profile_tags.append(profile_tag)
             else:
@@ -772,7 +1256,9 @@ class Helpers(object):
 
     @staticmethod
     def get_a_gender_profile_tag(avatar_id):
-        profile_tag = ProfileTag.query.filter(
+        profile_tag = ProfileTag.query.options(
+            joinedload(ProfileTag.sub_tag)
+        ).filter(
             ProfileTag.avatar_id == avatar_id,
             ProfileTag.super_tag_id == TagId.gender,
             ProfileTag.is_active == True
@@ -815,15 +1301,16 @@ class Helpers(object):
 
     @staticmethod
     def get_bookmarks_total(tag_id: int) -> int:
-        bookmarks = Bookmark.query.filter(
-            Bookmark.sub_tag_id == tag_id,
-            Bookmark.is_active == True
-        ).all()
-        return len(bookmarks)
+        total = db_session.query(TagBookmarkTotal.total).filter(
+            TagBookmarkTotal.tag_id == tag_id
+        ).scalar()
+        return total or 0
 
     @staticmethod
     def get_bookmarks(avatar_id, super_id):
-        bookmarks = Bookmark.query.filter(
+        bookmarks = Bookmark.query.options(
+            joinedload(Bookmark.sub_tag)
+        ).filter(
             Bookmark.avatar_id == avatar_id,
             Bookmark.super_tag_id == super_id,
             Bookmark.is_active == True
@@ -852,17 +1339,11 @@ class Helpers(object):
             return False
         return super_id
 
-    @staticmethod
-    def get_a_log_history_even_inactive(avatar_id, tag_id):
-        log_history = LogHistory.query.filter(
-            LogHistory.avatar_id == avatar_id,
-            LogHistory.tag_id == tag_id
-        ).first()
-        return log_history
-
     @staticmethod
     def get_log_histories(avatar_id):
-        log_histories = LogHistory.query.filter(
+        log_histories = LogHistory.query.options(
+            joinedload(LogHistory.tag)
+        ).filter(
             LogHistory.avatar_id == avatar_id,
             LogHistory.is_active == True
         ).order_by(
@@ -1022,23 +1503,22 @@ class Helpers(object):
 
     @staticmethod
     def create_log(data):
+        """Write one tag log and touch its log history in one transaction.
+
+        The log group upsert (or count bump) and the tag log insert share a
+        single statement; None means the tag or the log group is unknown.
+        """
         tag = Helpers.get_a_tag(data['tag_id'])
-        try:
-            log_group_id = data['log_group_id']
-        except KeyError:
-            log_group_id = None
+        if tag is None:
+            return None
+        log_group = LogGroup.__table__
+        column = LOG_CNT_COLUMNS.get(tag.tag_type)
+        log_group_id = data.get('log_group_id')
         if log_group_id is None:
-            # Create new log group
-            food_cnt = 0
-            act_cnt = 0
-            drug_cnt = 0
-            if tag.tag_type == TagType.food:
-                food_cnt = 1
-            elif tag.tag_type == TagType.activity:
-                act_cnt = 1
-            elif tag.tag_type == TagType.drug:
-                drug_cnt = 1
-            new_log_group = LogGroup(
+            counts = dict(food_cnt=0, act_cnt=0, drug_cnt=0)
+            if column:
+                counts[column] = 1
+            group = upsert_log_groups(dict(
                 avatar_id=data['avatar_id'],
                 group_type=data['group_type'],
                 year_number=data['year_number'],
@@ -1047,70 +1527,190 @@ class Helpers(object):
                 day_of_year=data['day_of_year'],
                 log_date=data['log_date'],
                 is_active=True,
-                food_cnt=food_cnt,
-                act_cnt=act_cnt,
-                drug_cnt=drug_cnt,
-            )
-            db_session.add(new_log_group)
-            db_session.commit()
-            log_group_id = new_log_group.id
+                **counts
+            ))
         else:
-            # Existed log group
-            log_group = LogGroup.query.filter(
-                LogGroup.id == log_group_id,
-                LogGroup.avatar_id == data['avatar_id'],
-                LogGroup.is_active == True
-            ).first()
-            if tag.tag_type == TagType.food:
-                log_group.food_cnt += 1
-            elif tag.tag_type == TagType.activity:
-                log_group.act_cnt += 1
-            elif tag.tag_type == TagType.drug:
-                log_group.drug_cnt += 1
-        new_tag_log = TagLog(
-            group_id=log_group_id,
+            values = dict(modified_timestamp=text(
+                "timezone('utc'::text, now())"))
+            if column:
+                values[column] = log_group.c[column] + 1
+            group = log_group.update().where(and_(
+                log_group.c.id == log_group_id,
+                log_group.c.avatar_id == data['avatar_id'],
+                log_group.c.is_active == True
+            )).values(**values)
+        group = group.returning(log_group.c.id).cte('new_log_group')
+        tag_log = TagLog.__table__
+        row = db_session.execute(tag_log.insert().from_select(
+            ['group_id', 'tag_id', 'is_active', 'x_val', 'y_val'],
+            select([group.c.id,
+                    literal(tag.id),
+                    literal(True),
+                    literal(data['x_val'], type_=tag_log.c.x_val.type),
+                    literal(data['y_val'], type_=tag_log.c.y_val.type)])
+        ).returning(tag_log.c.id, tag_log.c.group_id)).first()
+        if row is None:
+            db_session.rollback()
+            return None
+        Helpers.upsert_log_histories([dict(
+            avatar_id=data['avatar_id'],
             tag_id=tag.id,
             is_active=True,
-            x_val=data['x_val'],
-            y_val=data['y_val']
-        )
-        db_session.add(new_tag_log)
+            modified_timestamp=text("timezone('utc'::text, now())")
+        )])
         db_session.commit()
+        return dict(log_group_id=row.group_id, tag_log_id=row.id)
+
+    @staticmethod
+    def create_logs(logs: [dict]) -> [dict]:
+        results = [dict(idx=idx, ok=True) for idx in range(len(logs))]
+        known_tags = Helpers.get_tags(data['tag_id'] for data in logs)
+        tags = dict()
+        log_dates = dict()
+        for idx, data in enumerate(logs):
+            tag = known_tags.get(int(data['tag_id']))
+            if tag is None:
+                results[idx] = dict(idx=idx, ok=False,
+                                    message=MsgPattern.NONEXISTENT.format(
+                                        data['tag_id']))
+                continue
+            tags[idx] = tag
+            if data.get('log_group_id') is None:
+                try:
+                    log_dates[idx] = str_to_date(data['log_date'])
+                except ValueError:
+                    results[idx] = dict(idx=idx, ok=False,
+                                        message=MsgPattern.INVALID.format(
+                                            'log_date'))
+        group_ids = set(data['log_group_id'] for data in logs
+                        if data.get('log_group_id') is not None)
+        valid_groups = set()
+        if group_ids:
+            valid_groups = set(db_session.query(
+                LogGroup.id, LogGroup.avatar_id
+            ).filter(
+                LogGroup.id.in_(group_ids),
+                LogGroup.is_active == True
+            ).all())
+
+        # Logs without a group that share avatar, date and time of day go
+        # into one group, the already active one if there is, just like a
+        # meal entered on the app.
+        new_groups = dict()
+        deltas = dict()
+        for idx, data in enumerate(logs):
+            if not results[idx]['ok']:
+                continue
+            group_id = data.get('log_group_id')
+            column = LOG_CNT_COLUMNS.get(tags[idx].tag_type)
+            if group_id is None:
+                key = (data['avatar_id'], log_dates[idx], data['group_type'])
+                group = new_groups.get(key)
+                if group is None:
+                    group = new_groups[key] = dict(
+                        avatar_id=data['avatar_id'],
+                        group_type=data['group_type'],
+                        year_number=data['year_number'],
+                        month_number=data['month_number'],
+                        week_of_year=data['week_of_year'],
+                        day_of_year=data['day_of_year'],
+                        log_date=key[1],
+                        is_active=True,
+                        food_cnt=0,
+                        act_cnt=0,
+                        drug_cnt=0
+                    )
+                if column:
+                    group[column] += 1
+            elif (group_id, data['avatar_id']) not in valid_groups:
+                results[idx] = dict(idx=idx, ok=False,
+                                    message=MsgPattern.NONEXISTENT.format(
+                                        group_id))
+            elif column:
+                delta = deltas.setdefault(group_id, dict(food_cnt=0,
+                                                         act_cnt=0,
+                                                         drug_cnt=0))
+                delta[column] += 1
+
+        group_id_by_key = dict()
+        if new_groups:
+            rows = db_session.execute(
+                upsert_log_groups(
+                    list(new_groups.values())
+                ).returning(LogGroup.id, LogGroup.avatar_id,
+                            LogGroup.log_date, LogGroup.group_type)
+            ).fetchall()
+            for row in rows:
+                group_id_by_key[(row.avatar_id, row.log_date,
+                                 row.group_type)] = row.id
+        Helpers.update_log_group_log_cnts(deltas)
+
+        tag_logs = list()
+        log_histories = dict()
+        for idx, data in enumerate(logs):
+            if not results[idx]['ok']:
+                continue
+            group_id = data.get('log_group_id')
+            if group_id is None:
+                group_id = group_id_by_key[(data['avatar_id'],
+                                            log_dates[idx],
+                                            data['group_type'])]
+            results[idx]['log_group_id'] = group_id
+            tag_logs.append(dict(group_id=group_id,
+                                 tag_id=data['tag_id'],
+                                 is_active=True,
+                                 x_val=data['x_val'],
+                                 y_val=data['y_val']))
+            log_histories[(data['avatar_id'], data['tag_id'])] = dict(
+                avatar_id=data['avatar_id'],
+                tag_id=data['tag_id'],
+                is_active=True,
+                modified_timestamp=text("timezone('utc'::text, now())")
+            )
+        if tag_logs:
+            db_session.execute(TagLog.__table__.insert().values(tag_logs))
+            Helpers.upsert_log_histories(list(log_histories.values()))
+        db_session.commit()
+        return results
+
+    @staticmethod
+    def upsert_log_histories(log_histories: [dict]):
+        stmt = pg_insert(LogHistory.__table__).values(log_histories)
+        db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[LogHistory.avatar_id, LogHistory.tag_id],
+            set_=dict(modified_timestamp=stmt.excluded.modified_timestamp)
+        ))
+        return True
 
     @staticmethod
     def create_cond_log(data):
         tag = Helpers.get_a_tag(data['tag_id'])
-        avatar_cond = AvatarCond.query.filter(
-            AvatarCond.avatar_id == data['avatar_id'],
-            AvatarCond.tag_id == tag.id,
-            AvatarCond.is_active == True
-        ).first()
-        if avatar_cond:
-            if data['cond_log_type'] == CondLogType.start_date:
-                avatar_cond.start_date = data['log_date']
-            else:
-                avatar_cond.end_date = data['log_date']
-            avatar_cond.modified_timestamp = text("timezone('utc'::text, now())")
-            db_session.commit()
-            return True
+        if tag is None:
+            return False
+        if data['cond_log_type'] == CondLogType.start_date:
+            date_column = 'start_date'
         else:
-            if data['cond_log_type'] == CondLogType.start_date:
-                avatar_cond = AvatarCond(
-                    avatar_id=data['avatar_id'],
-                    tag_id=tag.id,
-                    is_active=True,
-                    start_date=data['log_date']
-                )
-            else:
-                avatar_cond = AvatarCond(
-                    avatar_id=data['avatar_id'],
-                    tag_id=tag.id,
-                    is_active=True,
-                    end_date=data['log_date']
-                )
-            db_session.add(avatar_cond)
-            db_session.commit()
-            return True
+            date_column = 'end_date'
+        stmt = pg_insert(AvatarCond.__table__).values(
+            avatar_id=data['avatar_id'],
+            tag_id=tag.id,
+            is_active=True,
+            **{date_column: data['log_date']}
+        )
+        db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[AvatarCond.avatar_id, AvatarCond.tag_id],
+            index_where=AvatarCond.is_active == True,
+            set_={date_column: stmt.excluded[date_column],
+                  'modified_timestamp': text("timezone('utc'::text, now())")}
+        ))
+        Helpers.upsert_log_histories([dict(
+            avatar_id=data['avatar_id'],
+            tag_id=tag.id,
+            is_active=True,
+            modified_timestamp=text("timezone('utc'::text, now())")
+        )])
+        db_session.commit()
+        return True
 
     @staticmethod
     def create_profile_tag(avatar_id, super_tag_id, sub_tag_id, is_selected):
@@ -1158,20 +1758,10 @@ class Helpers(object):
             is_active=True
         )
         db_session.add(bookmark)
+        Helpers.update_bookmarks_total(sub_id, 1)
         db_session.commit()
         return bookmark.id
 
-    @staticmethod
-    def create_a_log_history(avatar_id, tag_id):
-        log_history = LogHistory(
-            avatar_id=avatar_id,
-            tag_id=tag_id,
-            is_active=True,
-            modified_timestamp=text("timezone('utc'::text, now())")
-        )
-        db_session.add(log_history)
-        db_session.commit()
-
     @staticmethod
     def upload_single_file(file, location, filename):
         file.save(os.path.join(location, filename))
@@ -1253,7 +1843,18 @@ class Helpers(object):
 
     @staticmethod
     def update_log_group_cond_score(log_group: LogGroup, score):
+        # Lock the row so concurrent score changes see each other's value.
+        db_session.refresh(log_group, with_for_update=True)
+        old_score = log_group.cond_score
+        if log_group.is_active and (score is not None
+                                    or old_score is not None):
+            Helpers.update_score_rollups(
+                log_group,
+                (score or 0) - (old_score or 0),
+                (score is not None) - (old_score is not None)
+            )
         log_group.cond_score = score
+        log_group.modified_timestamp = text("timezone('utc'::text, now())")
         db_session.commit()
         return True
 
@@ -1262,35 +1863,206 @@ class Helpers(object):
         if len(note) <= 0:
             note = None
         log_group.note = note
+        log_group.modified_timestamp = text("timezone('utc'::text, now())")
         db_session.commit()
         return True
 
     @staticmethod
     def update_log_group_is_active(log_group: LogGroup):
+        db_session.refresh(log_group, with_for_update=True)
+        if log_group.is_active and log_group.cond_score is not None:
+            Helpers.update_score_rollups(log_group, -log_group.cond_score, -1)
         log_group.is_active = False
+        log_group.modified_timestamp = text("timezone('utc'::text, now())")
         db_session.commit()
         return True
 
     @staticmethod
-    def update_log_group_log_cnt(log_group: LogGroup, tag_type):
-        if tag_type == TagType.food:
-            log_group.food_cnt -= 1
-        elif tag_type == TagType.activity:
-            log_group.act_cnt -= 1
-        elif tag_type == TagType.drug:
-            log_group.drug_cnt -= 1
+    def update_score_rollups(log_group: LogGroup, score_delta, cnt_delta):
+        # Flushed with the log group itself; the caller commits.
+        stmt = pg_insert(ScoreRollup.__table__).values([
+            dict(avatar_id=log_group.avatar_id,
+                 period_type=period_type,
+                 year_number=year_number,
+                 period_number=period_number,
+                 score_sum=score_delta,
+                 score_cnt=cnt_delta,
+                 modified_timestamp=text("timezone('utc'::text, now())"))
+            for period_type, year_number, period_number
+            in score_periods(log_group)
+        ])
+        db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[ScoreRollup.avatar_id, ScoreRollup.period_type,
+                            ScoreRollup.year_number,
+                            ScoreRollup.period_number],
+            set_=dict(
+                score_sum=ScoreRollup.score_sum + stmt.excluded.score_sum,
+                score_cnt=ScoreRollup.score_cnt + stmt.excluded.score_cnt,
+                modified_timestamp=stmt.excluded.modified_timestamp
+            )
+        ))
+        return True
+
+    @staticmethod
+    def rebuild_score_rollups() -> int:
+        # A delta upserted between the delete and the inserts would be
+        # counted twice or lost. The lock makes update_score_rollups wait
+        # for this transaction; plain reads go on.
+        db_session.execute('LOCK TABLE score_rollup IN EXCLUSIVE MODE')
+        ScoreRollup.query.delete(synchronize_session=False)
+        periods = ((PeriodType.day, LogGroup.day_of_year),
+                   (PeriodType.week, LogGroup.week_of_year),
+                   (PeriodType.month, LogGroup.month_number),
+                   (PeriodType.year, None))
+        total = 0
+        for period_type, period_number in periods:
+            # GROUP BY 0 would be read as a column position, so the year
+            # rows group without a period column.
+            keys = [LogGroup.avatar_id, LogGroup.year_number]
+            if period_number is None:
+                period_number = literal(0)
+            else:
+                keys.append(period_number)
+            rolled = db_session.query(
+                LogGroup.avatar_id,
+                literal(period_type),
+                LogGroup.year_number,
+                period_number,
+                func.sum(LogGroup.cond_score),
+                func.count(LogGroup.id),
+                literal_column("timezone('utc'::text, now())")
+            ).filter(
+                LogGroup.is_active == True,
+                LogGroup.cond_score != None
+            ).group_by(*keys)
+            result = db_session.execute(
+                ScoreRollup.__table__.insert().from_select(
+                    ['avatar_id', 'period_type', 'year_number',
+                     'period_number', 'score_sum', 'score_cnt',
+                     'modified_timestamp'],
+                    rolled.statement
+                )
+            )
+            total += result.rowcount
+        db_session.commit()
+        return total
+
+    @staticmethod
+    def update_tag_impacts(avatar_id) -> int:
+        history = load_tag_history(Helpers.get_tag_impact_history(avatar_id))
+        impacts = compute_tag_impacts(history)
+        TagImpact.query.filter(
+            TagImpact.avatar_id == avatar_id
+        ).delete(synchronize_session=False)
+        if impacts:
+            db_session.execute(TagImpact.__table__.insert(), [
+                dict(impact, avatar_id=avatar_id,
+                     modified_timestamp=datetime.datetime.utcnow())
+                for impact in impacts
+            ])
         db_session.commit()
+        return len(impacts)
+
+    @staticmethod
+    def update_full_lifespans(start_date=None, end_date=None) -> int:
+        # Defaults to the window fetch_remaining_life_span averages: from
+        # the first of this month last year through today.
+        today = datetime.date.today()
+        if start_date is None:
+            start_date = '{0}-{1}-{2}'.format(today.year - 1, today.month, 1)
+        if end_date is None:
+            end_date = '{0}-{1}-{2}'.format(today.year, today.month,
+                                            today.day)
+        rows = Helpers.get_avg_scores_between_dates(start_date, end_date)
+        if not rows:
+            return 0
+        avatar_ids, avg_scores = zip(*rows)
+        # Quantized on the exact Decimal, half-even like the '.2f' format of
+        # fetch_remaining_life_span, so both agree on the score.
+        cent = decimal.Decimal('0.01')
+        lifespans = full_lifespan_days([
+            int(score.quantize(cent, rounding=decimal.ROUND_HALF_EVEN) * 100)
+            for score in avg_scores
+        ])
+        avatar = Avatar.__table__
+        db_session.execute(
+            avatar.update().where(and_(
+                avatar.c.id == bindparam('_id'),
+                avatar.c.full_lifespan.is_distinct_from(
+                    bindparam('_full_lifespan'))
+            )).values(
+                full_lifespan=bindparam('_full_lifespan'),
+                modified_timestamp=text("timezone('utc'::text, now())")
+            ),
+            [dict(_id=avatar_id, _full_lifespan=int(lifespan))
+             for avatar_id, lifespan in zip(avatar_ids, lifespans)]
+        )
+        db_session.commit()
+        return len(rows)
+
+    @staticmethod
+    def update_log_group_log_cnt(group_id, tag_type, step=-1):
+        column = LOG_CNT_COLUMNS.get(tag_type)
+        if not column:
+            return True
+        delta = dict(food_cnt=0, act_cnt=0, drug_cnt=0)
+        delta[column] = step
+        return Helpers.update_log_group_log_cnts({group_id: delta})
+
+    @staticmethod
+    def update_log_group_log_cnts(deltas: dict):
+        # deltas maps group_id to dict(food_cnt=, act_cnt=, drug_cnt=); one
+        # server-side UPDATE statement is sent for all groups, so concurrent
+        # writers never overwrite each other's counts. The caller commits.
+        deltas = {group_id: delta for group_id, delta in deltas.items()
+                  if any(delta.values())}
+        if not deltas:
+            return True
+        log_group = LogGroup.__table__
+
+        def shifted(column):
+            return log_group.c[column] + bindparam('_' + column)
+        db_session.execute(
+            log_group.update().where(
+                log_group.c.id == bindparam('_id')
+            ).values(
+                food_cnt=shifted('food_cnt'),
+                act_cnt=shifted('act_cnt'),
+                drug_cnt=shifted('drug_cnt'),
+                modified_timestamp=text("timezone('utc'::text, now())")
+            ),
+            [dict(_id=group_id,
+                  _food_cnt=delta['food_cnt'],
+                  _act_cnt=delta['act_cnt'],
+                  _drug_cnt=delta['drug_cnt'])
+             for group_id, delta in deltas.items()]
+        )
         return True
 
     @staticmethod
-    def update_tag_log(tag_log: TagLog):
-        tag_log.is_active = False
+    def update_tag_log(tag_log_id):
+        tag_log = TagLog.__table__
+        row = db_session.execute(
+            tag_log.update().where(and_(
+                tag_log.c.id == tag_log_id,
+                tag_log.c.is_active == True
+            )).values(
+                is_active=False,
+                modified_timestamp=text("timezone('utc'::text, now())")
+            ).returning(tag_log.c.group_id, tag_log.c.tag_id)
+        ).first()
+        if row is None:
+            db_session.rollback()
+            return False
+        tag = Helpers.get_a_tag(row.tag_id)
+        Helpers.update_log_group_log_cnt(row.group_id, tag.tag_type)
         db_session.commit()
         return True
 
     @staticmethod
     def update_avatar_cond_is_active(avatar_cond: AvatarCond):
         avatar_cond.is_active = False
+        avatar_cond.modified_timestamp = text("timezone('utc'::text, now())")
         db_session.commit()
         return True
 
@@ -1298,13 +2070,55 @@ class Helpers(object):
     def update_bookmark_is_active(bookmark: Bookmark):
         if bookmark.is_active:
             bookmark.is_active = False
+            Helpers.update_bookmarks_total(bookmark.sub_tag_id, -1)
         else:
             bookmark.is_active = True
+            Helpers.update_bookmarks_total(bookmark.sub_tag_id, 1)
+        bookmark.modified_timestamp = text("timezone('utc'::text, now())")
         db_session.commit()
         return True
 
     @staticmethod
-    def update_log_history_date(log_history: LogHistory):
-        log_history.modified_timestamp = text("timezone('utc'::text, now())")
-        db_session.commit()
+    def update_bookmarks_total(tag_id, delta):
+        # Flushed with the bookmark itself; the caller commits.
+        stmt = pg_insert(TagBookmarkTotal.__table__).values(
+            tag_id=tag_id,
+            total=delta,
+            modified_timestamp=text("timezone('utc'::text, now())")
+        )
+        db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[TagBookmarkTotal.tag_id],
+            set_=dict(total=TagBookmarkTotal.total + stmt.excluded.total,
+                      modified_timestamp=stmt.excluded.modified_timestamp)
+        ))
         return True
+
+    @staticmethod
+    def reconcile_bookmarks_total() -> int:
+        counted = db_session.query(
+            Bookmark.sub_tag_id,
+            func.count(Bookmark.id),
+            literal_column("timezone('utc'::text, now())")
+        ).filter(
+            Bookmark.is_active == True
+        ).group_by(Bookmark.sub_tag_id)
+        stmt = pg_insert(TagBookmarkTotal.__table__).from_select(
+            ['tag_id', 'total', 'modified_timestamp'], counted.statement
+        )
+        fixed = db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[TagBookmarkTotal.tag_id],
+            set_=dict(total=stmt.excluded.total,
+                      modified_timestamp=stmt.excluded.modified_timestamp),
+            where=(TagBookmarkTotal.total != stmt.excluded.total)
+        )).rowcount
+        active = db_session.query(Bookmark.sub_tag_id).filter(
+            Bookmark.is_active == True
+        )
+        fixed += db_session.query(TagBookmarkTotal).filter(
+            TagBookmarkTotal.total != 0,
+            ~TagBookmarkTotal.tag_id.in_(active)
+        ).update({"total": 0,
+                  "modified_timestamp": text("timezone('utc'::text, now())")},
+                 synchronize_session=False)
+        db_session.commit()
+        return fixed
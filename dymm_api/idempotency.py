@@ -0,0 +1,127 @@
+import datetime, functools, hashlib
+
+from flask import current_app, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from dymm_api import db
+from .errors import bad_req, conflict
+from .models import IdempotencyKey
+from .patterns import MsgPattern
+
+db_session = db.session
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+
+
+def request_hash() -> str:
+    digest = hashlib.sha256()
+    digest.update('{0} {1}\n'.format(request.method,
+                                     request.path).encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _owner() -> str:
+    identity = get_jwt_identity()
+    if isinstance(identity, dict):
+        identity = identity.get('email')
+    return str(identity)
+
+
+def _reserve(owner, key, hashed):
+    # Claim the key with an empty response. An expired row is taken over,
+    # a live one is left alone and nothing is returned.
+    ttl = current_app.config.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    now = datetime.datetime.utcnow()
+    table = IdempotencyKey.__table__
+    stmt = pg_insert(table).values(
+        owner=owner,
+        key=key,
+        request_hash=hashed,
+        expires_timestamp=now + datetime.timedelta(seconds=ttl)
+    )
+    row = db_session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.owner, table.c.key],
+        set_=dict(request_hash=stmt.excluded.request_hash,
+                  status_code=None,
+                  response_body=None,
+                  created_timestamp=now,
+                  expires_timestamp=stmt.excluded.expires_timestamp),
+        where=table.c.expires_timestamp < now
+    ).returning(table.c.id)).first()
+    db_session.commit()
+    return row.id if row is not None else None
+
+
+def _store(reserved_id, response):
+    IdempotencyKey.query.filter(
+        IdempotencyKey.id == reserved_id
+    ).update({'status_code': response.status_code,
+              'response_body': response.get_data(as_text=True)},
+             synchronize_session=False)
+    db_session.commit()
+
+
+def _release(reserved_id):
+    IdempotencyKey.query.filter(
+        IdempotencyKey.id == reserved_id
+    ).delete(synchronize_session=False)
+    db_session.commit()
+
+
+def _replay(owner, key, hashed):
+    stored = IdempotencyKey.query.filter(
+        IdempotencyKey.owner == owner,
+        IdempotencyKey.key == key
+    ).first()
+    if stored is None or stored.status_code is None:
+        return conflict(MsgPattern.IN_PROGRESS.format(HEADER))
+    if stored.request_hash != hashed:
+        return bad_req(MsgPattern.REUSED.format(HEADER))
+    response = make_response(stored.response_body, stored.status_code)
+    response.mimetype = 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Replay the stored response when a POST is retried with the same
+    Idempotency-Key header, instead of running the write again.
+
+    Keys are scoped to the JWT identity and kept IDEMPOTENCY_KEY_TTL
+    seconds. Server errors are not stored, so those requests can be retried.
+    Goes below @jwt_required.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return bad_req(MsgPattern.BAD_PARAM)
+        owner = _owner()
+        hashed = request_hash()
+        reserved_id = _reserve(owner, key, hashed)
+        if reserved_id is None:
+            return _replay(owner, key, hashed)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db_session.rollback()
+            _release(reserved_id)
+            raise
+        if response.status_code >= 500:
+            _release(reserved_id)
+        else:
+            _store(reserved_id, response)
+        return response
+    return wrapper
+
+
+def purge_expired_keys() -> int:
+    purged = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_timestamp < datetime.datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db_session.commit()
+    return purged
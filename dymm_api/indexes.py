@@ -0,0 +1,263 @@
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+
+from .patterns import TagClass
+
+_CHOSUNG = 'ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ'
+_JUNGSUNG = 'ㅏㅐㅑㅒㅓㅔㅕㅖㅗㅘㅙㅚㅛㅜㅝㅞㅟㅠㅡㅢㅣ'
+_JONGSUNG = ('', 'ㄱ', 'ㄲ', 'ㄳ', 'ㄴ', 'ㄵ', 'ㄶ', 'ㄷ', 'ㄹ', 'ㄺ', 'ㄻ', 'ㄼ',
+             'ㄽ', 'ㄾ', 'ㄿ', 'ㅀ', 'ㅁ', 'ㅂ', 'ㅄ', 'ㅅ', 'ㅆ', 'ㅇ', 'ㅈ', 'ㅊ',
+             'ㅋ', 'ㅌ', 'ㅍ', 'ㅎ')
+# Compound jamo are split so a half-typed syllable (고) is a prefix of the
+# finished one (과).
+_COMPOUND_JAMO = str.maketrans({
+    'ㅘ': 'ㅗㅏ', 'ㅙ': 'ㅗㅐ', 'ㅚ': 'ㅗㅣ', 'ㅝ': 'ㅜㅓ', 'ㅞ': 'ㅜㅔ',
+    'ㅟ': 'ㅜㅣ', 'ㅢ': 'ㅡㅣ', 'ㄳ': 'ㄱㅅ', 'ㄵ': 'ㄴㅈ', 'ㄶ': 'ㄴㅎ',
+    'ㄺ': 'ㄹㄱ', 'ㄻ': 'ㄹㅁ', 'ㄼ': 'ㄹㅂ', 'ㄽ': 'ㄹㅅ', 'ㄾ': 'ㄹㅌ',
+    'ㄿ': 'ㄹㅍ', 'ㅀ': 'ㄹㅎ', 'ㅄ': 'ㅂㅅ'
+})
+_HANGUL_FIRST = 0xAC00
+_HANGUL_LAST = 0xD7A3
+
+
+def decompose_hangul(text: str) -> str:
+    jamo = list()
+    for char in text:
+        code = ord(char)
+        if _HANGUL_FIRST <= code <= _HANGUL_LAST:
+            code -= _HANGUL_FIRST
+            jamo.append(_CHOSUNG[code // 588])
+            jamo.append(_JUNGSUNG[(code % 588) // 28])
+            jamo.append(_JONGSUNG[code % 28])
+        else:
+            jamo.append(char)
+    return ''.join(jamo).translate(_COMPOUND_JAMO)
+
+
+def hangul_initials(text: str) -> str:
+    initials = list()
+    for char in text:
+        code = ord(char)
+        if _HANGUL_FIRST <= code <= _HANGUL_LAST:
+            initials.append(_CHOSUNG[(code - _HANGUL_FIRST) // 588])
+        elif not char.isspace():
+            initials.append(char)
+    return ''.join(initials)
+
+
+def is_hangul_initials(text: str) -> bool:
+    text = ''.join(text.split())
+    return bool(text) and all(char in _CHOSUNG for char in text)
+
+
+def is_hangul(char: str) -> bool:
+    return (_HANGUL_FIRST <= ord(char) <= _HANGUL_LAST
+            or 'ㄱ' <= char <= 'ㅣ')
+
+
+def tag_path(class1, *divisions) -> str:
+    """Hierarchy path as stored in Tag.hierarchy_path."""
+    return '.'.join('{0:05d}'.format(n) for n in (class1,) + divisions)
+
+
+def _subtree(path, min_depth=0, max_depth=5, exclude=None):
+    prefix = path + '.'
+    excluded = exclude + '.' if exclude else None
+
+    def scope(t):
+        return (t.hierarchy_path is not None
+                and t.hierarchy_path.startswith(prefix)
+                and min_depth <= t.hierarchy_depth <= max_depth
+                and (excluded is None
+                     or not (t.hierarchy_path + '.').startswith(excluded)))
+    return scope
+
+
+def tag_search_scopes(super_tag) -> list:
+    """Return one predicate per result segment of a search under super_tag.
+
+    Every scope is a range of Tag.hierarchy_path below the super tag. The
+    drug tags are the exception: they search the drug ABC classification,
+    and the drug root also returns supplements, each getting half a page.
+    """
+    depth = super_tag.hierarchy_depth
+    supplements = tag_path(TagClass.food, 20)  # 20: Supplements
+    if depth >= 5:
+        return False
+    if super_tag.class1 == TagClass.drug and depth <= 1:
+        # The drug tags are not linked below the drug super tags in TagSet,
+        # the searchable ones are the ABC classification, level 2 and down.
+        drug_abc = _subtree(tag_path(TagClass.drug_abc), min_depth=2)
+        if depth == 0:
+            return [drug_abc, _subtree(supplements)]
+        return [drug_abc]
+    if super_tag.class1 == TagClass.food and depth == 0:
+        return [_subtree(super_tag.hierarchy_path, exclude=supplements)]
+    if super_tag.class1 == TagClass.cond and depth <= 2:
+        return [_subtree(super_tag.hierarchy_path, max_depth=3)]
+    return [_subtree(super_tag.hierarchy_path)]
+
+
+class NgramIndex(object):
+    """Case-insensitive substring index over one name column of Tag.
+
+    Every name is posted under each of its characters and character
+    bigrams. A keyword is answered by intersecting the posting lists of its
+    bigrams (or its single character) and confirming the substring on the
+    few candidates left, which keeps LIKE '%kw%' semantics.
+    """
+
+    def __init__(self, tags, name_attr):
+        self.tags = list()
+        self.names = list()
+        self.postings = defaultdict(list)
+        for tag in tags:
+            name = getattr(tag, name_attr)
+            if not name:
+                continue
+            position = len(self.tags)
+            self.tags.append(tag)
+            self.names.append(name.lower())
+            for gram in self.grams(self.names[-1], unigrams=True):
+                self.postings[gram].append(position)
+
+    @staticmethod
+    def grams(text, unigrams=False) -> set:
+        grams = set(text[i:i + 2] for i in range(len(text) - 1))
+        if unigrams or len(text) == 1:
+            grams.update(text)
+        return grams
+
+    def search(self, keyword):
+        keyword = keyword.lower()
+        if not keyword:
+            return iter(self.tags)
+        postings = list()
+        for gram in self.grams(keyword):
+            posting = self.postings.get(gram)
+            if not posting:
+                return iter(())
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return iter(())
+        return (self.tags[position] for position in sorted(candidates)
+                if keyword in self.names[position])
+
+    def search_page(self, keyword, scopes, page=1, per_page=40) -> list:
+        per_segment = int(per_page // len(scopes))
+        start = (max(page or 1, 1) - 1) * per_segment
+        tags = list()
+        for scope in scopes:
+            hits = (tag for tag in self.search(keyword) if scope(tag))
+            tags.extend(islice(hits, start, start + per_segment))
+        return tags
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = dict()
+        self.top = list()
+
+
+class PrefixTrie(object):
+    """Prefix index over tag name keys with precomputed top results.
+
+    Nodes are kept down to MAX_DEPTH characters and remember the TOP_SIZE
+    best ranked tags below them, so short prefixes are answered from a
+    single node. Longer or heavily filtered prefixes fall back to a bisect
+    range over the sorted keys.
+    """
+    MAX_DEPTH = 6
+    TOP_SIZE = 20
+
+    def __init__(self, entries):
+        self.tags = list()
+        self.root = _TrieNode()
+        positions = dict()
+        keys = list()
+        ranked = sorted(entries, key=lambda entry: entry[2])
+        for order, (key, tag, _) in enumerate(ranked):
+            position = positions.get(tag.id)
+            if position is None:
+                position = positions[tag.id] = len(self.tags)
+                self.tags.append(tag)
+            keys.append((key, order, position))
+            node = self.root
+            self._remember(node, position)
+            for char in key[:self.MAX_DEPTH]:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _TrieNode()
+                node = child
+                self._remember(node, position)
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.entries = [(order, position) for _, order, position in keys]
+
+    def _remember(self, node, position):
+        if len(node.top) < self.TOP_SIZE and position not in node.top:
+            node.top.append(position)
+
+    def complete(self, prefix, predicate=None, limit=10) -> list:
+        if len(prefix) <= self.MAX_DEPTH:
+            node = self.root
+            for char in prefix:
+                node = node.children.get(char)
+                if node is None:
+                    return list()
+            tags = [self.tags[position] for position in node.top
+                    if predicate is None or predicate(self.tags[position])]
+            if len(tags) >= limit or len(node.top) < self.TOP_SIZE:
+                return tags[:limit]
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        tags = list()
+        seen = set()
+        for _, position in sorted(self.entries[lo:hi]):
+            if position in seen:
+                continue
+            seen.add(position)
+            tag = self.tags[position]
+            if predicate is None or predicate(tag):
+                tags.append(tag)
+                if len(tags) >= limit:
+                    break
+        return tags
+
+
+def _word_starts(name: str):
+    for i, char in enumerate(name):
+        if i == 0 or (name[i - 1].isspace() or name[i - 1] in '(/,-'):
+            if not char.isspace():
+                yield name[i:]
+
+
+def build_prefix_trie(tags, kind) -> PrefixTrie:
+    """Build the trie for one kind of key: eng, jpn, kor or kor_initials.
+
+    Korean names are keyed by their decomposed jamo (kor) and by their
+    initial consonants (kor_initials), so 김ㅊ and ㄱㅊ both reach 김치.
+    """
+    name_attr = ('kor' if kind.startswith('kor') else kind) + '_name'
+    entries = list()
+    for tag in tags:
+        name = getattr(tag, name_attr)
+        if not name:
+            continue
+        name = name.strip().lower()
+        rank = (len(name), name, tag.id)
+        if kind == 'kor_initials':
+            entries.append((hangul_initials(name), tag, rank))
+            continue
+        for start in _word_starts(name):
+            if kind == 'kor':
+                start = decompose_hangul(start)
+            entries.append((start, tag, rank))
+    return PrefixTrie(entries)
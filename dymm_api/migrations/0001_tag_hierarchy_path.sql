@@ -0,0 +1,35 @@
+-- Materialized class/division path of every tag, e.g. '00005.00020.00003'
+-- for class1 = 5, division1 = 20, division2 = 3. The taxonomy cache loads it
+-- with every active tag and tag_search_scopes matches subtrees by path
+-- prefix in Python; the "C" collation keeps the sort order bytewise, the
+-- same as Python string comparison.
+ALTER TABLE tag
+    ADD COLUMN hierarchy_path varchar(40) COLLATE "C",
+    ADD COLUMN hierarchy_depth smallint;
+
+CREATE OR REPLACE FUNCTION tag_hierarchy_path() RETURNS trigger AS $$
+DECLARE
+    division smallint;
+BEGIN
+    NEW.hierarchy_path := lpad(coalesce(NEW.class1, 0)::text, 5, '0');
+    NEW.hierarchy_depth := 0;
+    FOREACH division IN ARRAY ARRAY[NEW.division1, NEW.division2,
+                                    NEW.division3, NEW.division4,
+                                    NEW.division5]
+    LOOP
+        EXIT WHEN division IS NULL OR division = 0;
+        NEW.hierarchy_path := NEW.hierarchy_path || '.'
+                              || lpad(division::text, 5, '0');
+        NEW.hierarchy_depth := NEW.hierarchy_depth + 1;
+    END LOOP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tag_hierarchy_path
+    BEFORE INSERT OR UPDATE OF class1, division1, division2, division3,
+                               division4, division5
+    ON tag
+    FOR EACH ROW EXECUTE PROCEDURE tag_hierarchy_path();
+
+UPDATE tag SET class1 = class1;
@@ -0,0 +1,11 @@
+CREATE TABLE tag_bookmark_total (
+    tag_id integer PRIMARY KEY REFERENCES tag (id) ON DELETE CASCADE,
+    total integer NOT NULL DEFAULT 0,
+    modified_timestamp timestamp
+);
+
+INSERT INTO tag_bookmark_total (tag_id, total, modified_timestamp)
+SELECT sub_tag_id, count(*), timezone('utc'::text, now())
+FROM bookmark
+WHERE is_active
+GROUP BY sub_tag_id;
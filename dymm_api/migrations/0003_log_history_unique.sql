@@ -0,0 +1,21 @@
+-- Log writes upsert log_history on (avatar_id, tag_id), keep the most
+-- recently touched row of any existing duplicates.
+DELETE FROM log_history
+WHERE id IN (
+    SELECT id
+    FROM (
+        SELECT id,
+               row_number() OVER (
+                   PARTITION BY avatar_id, tag_id
+                   ORDER BY is_active DESC,
+                            coalesce(modified_timestamp,
+                                     created_timestamp) DESC NULLS LAST,
+                            id DESC
+               ) AS rnk
+        FROM log_history
+    ) ranked
+    WHERE rnk > 1
+);
+
+CREATE UNIQUE INDEX ux_log_history_avatar_tag
+    ON log_history (avatar_id, tag_id);
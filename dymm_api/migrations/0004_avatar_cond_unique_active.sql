@@ -0,0 +1,24 @@
+-- Condition logs upsert avatar_cond on (avatar_id, tag_id) among active
+-- rows, keep the most recently touched one of any active duplicates.
+UPDATE avatar_cond
+SET is_active = FALSE,
+    modified_timestamp = timezone('utc'::text, now())
+WHERE id IN (
+    SELECT id
+    FROM (
+        SELECT id,
+               row_number() OVER (
+                   PARTITION BY avatar_id, tag_id
+                   ORDER BY coalesce(modified_timestamp,
+                                     created_timestamp) DESC NULLS LAST,
+                            id DESC
+               ) AS rnk
+        FROM avatar_cond
+        WHERE is_active
+    ) ranked
+    WHERE rnk > 1
+);
+
+CREATE UNIQUE INDEX ux_avatar_cond_avatar_tag_active
+    ON avatar_cond (avatar_id, tag_id)
+    WHERE is_active;
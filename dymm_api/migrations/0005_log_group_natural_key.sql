@@ -0,0 +1,52 @@
+-- Log writes upsert log_group on (avatar_id, log_date, group_type) among
+-- active rows. Fold active duplicates into the oldest group first: move
+-- their tag logs, add up their counts and keep their notes.
+CREATE TEMPORARY TABLE log_group_merge ON COMMIT DROP AS
+SELECT id,
+       first_value(id) OVER (
+           PARTITION BY avatar_id, log_date, group_type
+           ORDER BY id
+       ) AS keep_id
+FROM log_group
+WHERE is_active
+  AND log_date IS NOT NULL;
+
+DELETE FROM log_group_merge WHERE id = keep_id;
+
+UPDATE tag_log
+SET group_id = m.keep_id,
+    modified_timestamp = timezone('utc'::text, now())
+FROM log_group_merge m
+WHERE tag_log.group_id = m.id;
+
+UPDATE log_group
+SET food_cnt = log_group.food_cnt + s.food_cnt,
+    act_cnt = log_group.act_cnt + s.act_cnt,
+    drug_cnt = log_group.drug_cnt + s.drug_cnt,
+    cond_score = coalesce(log_group.cond_score, s.cond_score),
+    note = nullif(concat_ws(E'\n', log_group.note, s.note), ''),
+    modified_timestamp = timezone('utc'::text, now())
+FROM (
+    SELECT m.keep_id,
+           sum(d.food_cnt) AS food_cnt,
+           sum(d.act_cnt) AS act_cnt,
+           sum(d.drug_cnt) AS drug_cnt,
+           max(d.cond_score) AS cond_score,
+           string_agg(d.note, E'\n' ORDER BY d.id) AS note
+    FROM log_group_merge m
+    JOIN log_group d ON d.id = m.id
+    GROUP BY m.keep_id
+) s
+WHERE log_group.id = s.keep_id;
+
+UPDATE log_group
+SET is_active = FALSE,
+    food_cnt = 0,
+    act_cnt = 0,
+    drug_cnt = 0,
+    modified_timestamp = timezone('utc'::text, now())
+WHERE id IN (SELECT id FROM log_group_merge);
+
+CREATE UNIQUE INDEX ux_log_group_avatar_date_type
+    ON log_group (avatar_id, log_date, group_type)
+    WHERE is_active;
@@ -0,0 +1,18 @@
+-- Responses of POSTs sent with an Idempotency-Key header, replayed on
+-- retries until expires_timestamp.
+CREATE TABLE idempotency_key (
+    id serial PRIMARY KEY,
+    owner varchar(254) NOT NULL,
+    key varchar(64) NOT NULL,
+    request_hash varchar(64) NOT NULL,
+    status_code smallint,
+    response_body text,
+    created_timestamp timestamp DEFAULT timezone('utc'::text, now()),
+    expires_timestamp timestamp NOT NULL
+);
+
+CREATE UNIQUE INDEX ux_idempotency_key_owner_key
+    ON idempotency_key (owner, key);
+
+CREATE INDEX ix_idempotency_key_expires_timestamp
+    ON idempotency_key (expires_timestamp);
@@ -0,0 +1,13 @@
+-- Delta sync reads each table of an avatar in (changed_at, id) order,
+-- changed_at being coalesce(modified_timestamp, created_timestamp).
+CREATE INDEX ix_log_group_avatar_changed
+    ON log_group (avatar_id,
+                  (coalesce(modified_timestamp, created_timestamp)), id);
+
+CREATE INDEX ix_avatar_cond_avatar_changed
+    ON avatar_cond (avatar_id,
+                    (coalesce(modified_timestamp, created_timestamp)), id);
+
+CREATE INDEX ix_bookmark_avatar_changed
+    ON bookmark (avatar_id,
+                 (coalesce(modified_timestamp, created_timestamp)), id);
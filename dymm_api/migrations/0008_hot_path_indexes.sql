@@ -0,0 +1,56 @@
+-- Composite and partial indexes matched to the hot Helpers getters. Most
+-- of them only read active rows, so the partial indexes stay small. The
+-- getters sort every key descending, which a backward index scan serves.
+
+-- get_a_avatar(email=...), is_email_duplicated
+CREATE INDEX ix_avatar_email_active
+    ON avatar (email)
+    WHERE is_active;
+
+-- get_avt_cond_list
+CREATE INDEX ix_avatar_cond_avatar_dates_active
+    ON avatar_cond (avatar_id, end_date, start_date)
+    WHERE is_active;
+
+-- get_log_groups by month
+CREATE INDEX ix_log_group_avatar_month_active
+    ON log_group (avatar_id, year_number, month_number,
+                  day_of_year, group_type)
+    WHERE is_active;
+
+-- get_log_groups by week
+CREATE INDEX ix_log_group_avatar_week_active
+    ON log_group (avatar_id, year_number, week_of_year,
+                  day_of_year, group_type)
+    WHERE is_active;
+
+-- The get_avg_score_* getters read score_rollup through its primary key.
+
+-- get_groups_of_logs
+CREATE INDEX ix_tag_log_group_active
+    ON tag_log (group_id)
+    WHERE is_active;
+
+-- get_bookmarks
+CREATE INDEX ix_bookmark_avatar_super_active
+    ON bookmark (avatar_id, super_tag_id)
+    WHERE is_active;
+
+-- get_a_bookmark(avatar_id, tag_id), get_a_bookmark_include_inactive
+CREATE INDEX ix_bookmark_avatar_sub
+    ON bookmark (avatar_id, sub_tag_id);
+
+-- get_a_lang_profile_tag, get_a_gender_profile_tag, get_valid_profile_tags
+CREATE INDEX ix_profile_tag_avatar_super_active
+    ON profile_tag (avatar_id, super_tag_id)
+    WHERE is_active;
+
+-- get_log_histories
+CREATE INDEX ix_log_history_avatar_modified_active
+    ON log_history (avatar_id, modified_timestamp)
+    WHERE is_active;
+
+-- TaxonomyCache._load_children
+CREATE INDEX ix_tag_set_super_active
+    ON tag_set (super_id)
+    WHERE is_active;
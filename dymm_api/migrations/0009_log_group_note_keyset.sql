@@ -0,0 +1,5 @@
+-- Diary notes are paged newest first on (log_date, group_type, id); only
+-- groups with a note are indexed.
+CREATE INDEX ix_log_group_avatar_note
+    ON log_group (avatar_id, log_date, group_type, id)
+    WHERE note IS NOT NULL AND is_active;
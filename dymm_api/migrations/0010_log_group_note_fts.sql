@@ -0,0 +1,6 @@
+-- Full-text search over diary notes. The 'simple' configuration only
+-- lower-cases and splits words, which suits both English and Korean;
+-- searches use prefix queries so Korean particles do not get in the way.
+CREATE INDEX ix_log_group_note_fts
+    ON log_group USING gin (to_tsvector('simple', note))
+    WHERE note IS NOT NULL AND is_active;
@@ -0,0 +1,28 @@
+-- Sum and count of the active condition scores per avatar and day, week,
+-- month and year, kept up to date by the score and removal helpers.
+-- period_type: 1 day (period_number = day_of_year), 2 week (week_of_year),
+-- 3 month (month_number), 4 year (0).
+CREATE TABLE score_rollup (
+    avatar_id integer NOT NULL REFERENCES avatar (id) ON DELETE CASCADE,
+    period_type smallint NOT NULL,
+    year_number smallint NOT NULL,
+    period_number smallint NOT NULL,
+    score_sum integer NOT NULL DEFAULT 0,
+    score_cnt integer NOT NULL DEFAULT 0,
+    modified_timestamp timestamp,
+    PRIMARY KEY (avatar_id, period_type, year_number, period_number)
+);
+
+INSERT INTO score_rollup (avatar_id, period_type, year_number,
+                          period_number, score_sum, score_cnt,
+                          modified_timestamp)
+SELECT avatar_id, period_type, year_number, period_number,
+       sum(cond_score), count(*), timezone('utc'::text, now())
+FROM log_group,
+     LATERAL (VALUES (1, day_of_year),
+                     (2, week_of_year),
+                     (3, month_number),
+                     (4, 0)) AS period (period_type, period_number)
+WHERE is_active
+  AND cond_score IS NOT NULL
+GROUP BY avatar_id, period_type, year_number, period_number;
@@ -0,0 +1,16 @@
+-- Score effect of each tag an avatar logged, recomputed from the log
+-- groups by `flask compute-tag-impacts` or on request.
+CREATE TABLE tag_impact (
+    avatar_id integer NOT NULL REFERENCES avatar (id) ON DELETE CASCADE,
+    tag_id integer NOT NULL REFERENCES tag (id) ON DELETE CASCADE,
+    group_cnt integer NOT NULL,
+    lag_cnt integer NOT NULL,
+    avg_with real,
+    avg_without real,
+    score_diff real,
+    lag_diff real,
+    ci_low real,
+    ci_high real,
+    modified_timestamp timestamp,
+    PRIMARY KEY (avatar_id, tag_id)
+);
@@ -0,0 +1,49 @@
+import os
+
+from dymm_api import db
+
+MIGRATION_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def migration_files() -> [str]:
+    return sorted(name for name in os.listdir(MIGRATION_DIR)
+                  if name.endswith('.sql'))
+
+
+def upgrade(dry_run=False) -> [str]:
+    # Files run through the DBAPI cursor as-is, so they may hold several
+    # statements and plpgsql bodies. Each file is applied in its own
+    # transaction together with its schema_migration row.
+    conn = db.engine.raw_connection()
+    applied = list()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migration ("
+            "version varchar(100) PRIMARY KEY, "
+            "applied_timestamp timestamp NOT NULL "
+            "DEFAULT timezone('utc'::text, now()))"
+        )
+        cursor.execute("SELECT version FROM schema_migration")
+        done = set(row[0] for row in cursor.fetchall())
+        conn.commit()
+        for name in migration_files():
+            version = name[:-len('.sql')]
+            if version in done:
+                continue
+            applied.append(version)
+            if dry_run:
+                continue
+            with open(os.path.join(MIGRATION_DIR, name)) as f:
+                cursor.execute(f.read())
+            cursor.execute(
+                "INSERT INTO schema_migration (version) VALUES (%s)",
+                (version,)
+            )
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return applied
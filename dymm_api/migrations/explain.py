@@ -0,0 +1,196 @@
+import re
+
+from dymm_api import db
+
+# Temporary copies (LIKE ... INCLUDING ALL keeps every index) shadow the
+# real tables for the session, so the generated rows never touch them.
+# The fill statements go through the DBAPI with parameters, hence %%.
+SHADOW_TABLES = ('avatar', 'avatar_cond', 'bookmark', 'log_group',
+                 'log_history', 'profile_tag', 'score_rollup', 'tag_log',
+                 'tag_set')
+GROUPS_PER_AVATAR = 200
+
+_FILL = (
+    """INSERT INTO avatar (id, is_active, is_admin, is_blocked, is_confirmed,
+                           email, password_hash, first_name, last_name,
+                           color_code, full_lifespan, date_of_birth)
+       SELECT n, n %% 50 <> 0, FALSE, FALSE, TRUE,
+              'avatar' || n || '@example.com', 'x', 'First', 'Last',
+              n %% 10, 700000 + n, date '1950-01-01' + n %% 20000
+       FROM generate_series(1, %(avatars)s) n""",
+    """INSERT INTO log_group (id, avatar_id, year_number, month_number,
+                              week_of_year, day_of_year, group_type,
+                              is_active, log_date, food_cnt, act_cnt,
+                              drug_cnt, cond_score, note)
+       SELECT n, (n - 1) / %(groups)s + 1,
+              extract(year FROM d), extract(month FROM d),
+              extract(week FROM d), extract(doy FROM d),
+              (n - 1) %% 4 + 1, n %% 20 <> 0, d, 1, 1, 0, n %% 10,
+              CASE WHEN n %% 7 = 0 THEN 'note ' || n END
+       FROM (SELECT n, date '2019-01-01' + ((n - 1) %% %(groups)s) / 4 AS d
+             FROM generate_series(1, %(avatars)s * %(groups)s) n) days""",
+    """INSERT INTO score_rollup (avatar_id, period_type, year_number,
+                                 period_number, score_sum, score_cnt)
+       SELECT avatar_id, period_type, year_number, period_number,
+              sum(cond_score), count(*)
+       FROM log_group,
+            LATERAL (VALUES (1, day_of_year),
+                            (2, week_of_year),
+                            (3, month_number),
+                            (4, 0)) AS period (period_type, period_number)
+       WHERE is_active AND cond_score IS NOT NULL
+       GROUP BY avatar_id, period_type, year_number, period_number""",
+    """INSERT INTO tag_log (id, group_id, tag_id, is_active, x_val, y_val)
+       SELECT n, (n + 1) / 2, n %% 5000 + 1, n %% 25 <> 0, n %% 5, n %% 3
+       FROM generate_series(1, %(avatars)s * %(groups)s * 2) n""",
+    """INSERT INTO avatar_cond (id, avatar_id, tag_id, is_active,
+                                start_date, end_date)
+       SELECT n, (n - 1) / 20 + 1, (n - 1) %% 20 * 7 + 1, n %% 5 <> 0,
+              date '2018-01-01' + n %% 365, date '2019-01-01' + n %% 365
+       FROM generate_series(1, %(avatars)s * 20) n""",
+    """INSERT INTO bookmark (id, avatar_id, super_tag_id, sub_tag_id,
+                             is_active)
+       SELECT n, (n - 1) / 30 + 1, 100 + n %% 4, (n - 1) %% 30 * 11 + 1,
+              n %% 6 <> 0
+       FROM generate_series(1, %(avatars)s * 30) n""",
+    """INSERT INTO log_history (id, avatar_id, tag_id, is_active,
+                                modified_timestamp)
+       SELECT n, (n - 1) / 50 + 1, (n - 1) %% 50 * 3 + 1, TRUE,
+              timestamp '2019-06-01' - n * interval '1 minute'
+       FROM generate_series(1, %(avatars)s * 50) n""",
+    """INSERT INTO profile_tag (id, avatar_id, super_tag_id, sub_tag_id,
+                                is_active, is_selected)
+       SELECT n, (n - 1) / 10 + 1, 20 + (n - 1) %% 10, 30 + n %% 50, TRUE,
+              n %% 2 = 0
+       FROM generate_series(1, %(avatars)s * 10) n""",
+    """INSERT INTO tag_set (id, super_id, sub_id, is_active, priority)
+       SELECT n, n %% 500 + 1, n, n %% 10 <> 0, n %% 7
+       FROM generate_series(1, 20000) n""",
+)
+
+# (getter, statement) pairs written as Helpers sends them.
+HOT_QUERIES = (
+    ('get_a_avatar(email)',
+     """SELECT * FROM avatar
+        WHERE email = 'avatar42@example.com' AND is_active"""),
+    ('get_avt_cond_list',
+     """SELECT * FROM avatar_cond
+        WHERE avatar_id = 42 AND is_active
+        ORDER BY end_date DESC, start_date DESC"""),
+    ('get_log_groups(month)',
+     """SELECT * FROM log_group
+        WHERE avatar_id = 42 AND year_number = 2019 AND month_number = 2
+          AND is_active
+        ORDER BY day_of_year DESC, group_type DESC"""),
+    ('get_log_groups(week)',
+     """SELECT * FROM log_group
+        WHERE avatar_id = 42 AND year_number = 2019 AND week_of_year = 6
+          AND is_active
+        ORDER BY day_of_year DESC, group_type DESC"""),
+    ('get_log_group_note_page',
+     """SELECT * FROM log_group
+        WHERE avatar_id = 42 AND note IS NOT NULL AND is_active
+          AND log_date IS NOT NULL
+          AND (log_date, group_type, id) < ('2019-02-01', 1, 8325)
+        ORDER BY log_date DESC, group_type DESC, id DESC
+        LIMIT 21"""),
+    ('search_log_group_notes',
+     """SELECT * FROM log_group
+        WHERE avatar_id = 42 AND note IS NOT NULL AND is_active
+          AND to_tsvector('simple', note) @@ to_tsquery('simple', 'note:*')
+        ORDER BY round(ts_rank(to_tsvector('simple', note),
+                               to_tsquery('simple', 'note:*'))::numeric,
+                       6) DESC, id DESC
+        LIMIT 21"""),
+    ('get_avg_score_per_year',
+     """SELECT CAST(sum(score_sum) AS numeric) / nullif(sum(score_cnt), 0)
+        FROM score_rollup
+        WHERE avatar_id = 42 AND period_type = 4 AND year_number = 2019
+          AND period_number = 0"""),
+    ('get_avg_score_per_month',
+     """SELECT CAST(sum(score_sum) AS numeric) / nullif(sum(score_cnt), 0)
+        FROM score_rollup
+        WHERE avatar_id = 42 AND period_type = 3 AND year_number = 2019
+          AND period_number = 2"""),
+    ('get_avg_score_between_dates',
+     """SELECT CAST(sum(score_sum) AS numeric) / nullif(sum(score_cnt), 0)
+        FROM score_rollup
+        WHERE avatar_id = 42 AND period_type = 1
+          AND (year_number, period_number) >= (2019, 1)
+          AND (year_number, period_number) <= (2019, 31)"""),
+    ('get_score_series',
+     """SELECT year_number, period_number,
+               CAST(score_sum AS numeric) / nullif(score_cnt, 0)
+        FROM score_rollup
+        WHERE avatar_id = 42 AND period_type = 2
+          AND (year_number, period_number)
+              IN ((2019, 4), (2019, 5), (2019, 6))"""),
+    ('get_groups_of_logs',
+     """SELECT * FROM log_group
+        LEFT OUTER JOIN tag_log
+          ON tag_log.group_id = log_group.id AND tag_log.is_active
+        WHERE log_group.id IN (8201, 8202, 8203, 8204)
+          AND log_group.is_active
+        ORDER BY log_group.id, tag_log.id"""),
+    ('get_bookmarks',
+     """SELECT * FROM bookmark
+        WHERE avatar_id = 42 AND super_tag_id = 101 AND is_active"""),
+    ('get_a_bookmark_include_inactive',
+     """SELECT * FROM bookmark
+        WHERE avatar_id = 42 AND sub_tag_id = 12"""),
+    ('get_a_lang_profile_tag',
+     """SELECT * FROM profile_tag
+        WHERE avatar_id = 42 AND super_tag_id = 23 AND is_active"""),
+    ('get_log_histories',
+     """SELECT * FROM log_history
+        WHERE avatar_id = 42 AND is_active
+        ORDER BY modified_timestamp DESC"""),
+    ('TaxonomyCache._load_children',
+     """SELECT * FROM tag_set WHERE super_id = 42 AND is_active"""),
+    ('get_sync_changes(log_groups)',
+     """SELECT * FROM log_group
+        WHERE avatar_id = 42
+          AND (coalesce(modified_timestamp, created_timestamp), id)
+              > (timestamp '2019-01-01', 0)
+        ORDER BY coalesce(modified_timestamp, created_timestamp), id
+        LIMIT 201"""),
+)
+
+_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+_INDEX_SCAN = re.compile(r'Index (?:Only )?Scan(?: Backward)? using (\w+)'
+                         r'|Bitmap Index Scan on (\w+)')
+
+
+def explain_hot_queries(avatars=2000) -> [dict]:
+    """EXPLAIN every hot query against a generated dataset.
+
+    The data lives in temporary copies of the tables and the transaction
+    is rolled back at the end, so any database can be used. A query is
+    flagged when its plan sequentially scans one of the shadowed tables.
+    """
+    params = dict(avatars=int(avatars), groups=GROUPS_PER_AVATAR)
+    conn = db.engine.raw_connection()
+    reports = list()
+    try:
+        cursor = conn.cursor()
+        for table in SHADOW_TABLES:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE {0} (LIKE public.{0} INCLUDING ALL) '
+                'ON COMMIT DROP'.format(table)
+            )
+        for statement in _FILL:
+            cursor.execute(statement, params)
+        for table in SHADOW_TABLES:
+            cursor.execute('ANALYZE {0}'.format(table))
+        for name, statement in HOT_QUERIES:
+            cursor.execute('EXPLAIN ' + statement)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            seq_scans = [table for table in _SEQ_SCAN.findall(plan)
+                         if table in SHADOW_TABLES]
+            indexes = [a or b for a, b in _INDEX_SCAN.findall(plan)]
+            reports.append(dict(name=name, plan=plan, indexes=indexes,
+                                seq_scans=seq_scans))
+    finally:
+        conn.rollback()
+        conn.close()
+    return reports
@@ -1,5 +1,5 @@
-from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Integer,
-                        SmallInteger, String, text, Text, CHAR)
+from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Index,
+                        Integer, REAL, SmallInteger, String, text, Text, CHAR)
 from sqlalchemy.orm import relationship
 from dymm_api import db
 
@@ -8,6 +8,9 @@ Base = db.Model
 
 class Avatar(Base):
     __tablename__ = 'avatar'
+    __table_args__ = (
+        Index('ix_avatar_email_active', 'email', postgresql_where=text('is_active')),
+    )
 
     id = Column(Integer, primary_key=True)
     is_active = Column(Boolean, nullable=False)
@@ -47,6 +50,22 @@ class Banner(Base):
     modified_timestamp = Column(DateTime)
 
 
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        Index('ux_idempotency_key_owner_key', 'owner', 'key', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    owner = Column(String(254), nullable=False)
+    key = Column(String(64), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(SmallInteger)
+    response_body = Column(Text)
+    created_timestamp = Column(DateTime, server_default=text("timezone('utc'::text, now())"))
+    expires_timestamp = Column(DateTime, nullable=False, index=True)
+
+
 class Tag(Base):
     __tablename__ = 'tag'
 
@@ -64,6 +83,8 @@ class Tag(Base):
     division5 = Column(SmallInteger)
     created_timestamp = Column(DateTime, server_default=text("timezone('utc'::text, now())"))
     modified_timestamp = Column(DateTime)
+    hierarchy_path = Column(String(40, collation='C'), comment='Maintained by trigger tag_hierarchy_path')
+    hierarchy_depth = Column(SmallInteger, comment='Maintained by trigger tag_hierarchy_path')
 
 
 class AdminLog(Base):
@@ -81,6 +102,12 @@ class AdminLog(Base):
 
 class AvatarCond(Base):
     __tablename__ = 'avatar_cond'
+    __table_args__ = (
+        Index('ux_avatar_cond_avatar_tag_active', 'avatar_id', 'tag_id', unique=True,
+              postgresql_where=text('is_active')),
+        Index('ix_avatar_cond_avatar_dates_active', 'avatar_id', 'end_date', 'start_date',
+              postgresql_where=text('is_active')),
+    )
 
     id = Column(Integer, primary_key=True)
     avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -97,6 +124,11 @@ class AvatarCond(Base):
 
 class Bookmark(Base):
     __tablename__ = 'bookmark'
+    __table_args__ = (
+        Index('ix_bookmark_avatar_super_active', 'avatar_id', 'super_tag_id',
+              postgresql_where=text('is_active')),
+        Index('ix_bookmark_avatar_sub', 'avatar_id', 'sub_tag_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -113,6 +145,16 @@ class Bookmark(Base):
 
 class LogGroup(Base):
     __tablename__ = 'log_group'
+    __table_args__ = (
+        Index('ux_log_group_avatar_date_type', 'avatar_id', 'log_date', 'group_type', unique=True,
+              postgresql_where=text('is_active')),
+        Index('ix_log_group_avatar_month_active', 'avatar_id', 'year_number', 'month_number',
+              'day_of_year', 'group_type', postgresql_where=text('is_active')),
+        Index('ix_log_group_avatar_week_active', 'avatar_id', 'year_number', 'week_of_year',
+              'day_of_year', 'group_type', postgresql_where=text('is_active')),
+        Index('ix_log_group_avatar_note', 'avatar_id', 'log_date', 'group_type', 'id',
+              postgresql_where=text('note IS NOT NULL AND is_active')),
+    )
 
     id = Column(Integer, primary_key=True)
     avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -136,6 +178,11 @@ class LogGroup(Base):
 
 class LogHistory(Base):
     __tablename__ = 'log_history'
+    __table_args__ = (
+        Index('ux_log_history_avatar_tag', 'avatar_id', 'tag_id', unique=True),
+        Index('ix_log_history_avatar_modified_active', 'avatar_id', 'modified_timestamp',
+              postgresql_where=text('is_active')),
+    )
 
     id = Column(Integer, primary_key=True)
     avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -150,6 +197,10 @@ class LogHistory(Base):
 
 class ProfileTag(Base):
     __tablename__ = 'profile_tag'
+    __table_args__ = (
+        Index('ix_profile_tag_avatar_super_active', 'avatar_id', 'super_tag_id',
+              postgresql_where=text('is_active')),
+    )
 
     id = Column(Integer, primary_key=True, server_default=text("nextval('profile_tag_id_seq'::regclass)"))
     avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -165,8 +216,25 @@ class ProfileTag(Base):
     super_tag = relationship('Tag', primaryjoin='ProfileTag.super_tag_id == Tag.id')
 
 
+class ScoreRollup(Base):
+    __tablename__ = 'score_rollup'
+
+    avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    period_type = Column(SmallInteger, primary_key=True, nullable=False, comment='1: Day, 2: Week, 3: Month, 4: Year')
+    year_number = Column(SmallInteger, primary_key=True, nullable=False)
+    period_number = Column(SmallInteger, primary_key=True, nullable=False, comment='day_of_year, week_of_year, month_number or 0')
+    score_sum = Column(Integer, nullable=False, server_default=text("0"))
+    score_cnt = Column(Integer, nullable=False, server_default=text("0"))
+    modified_timestamp = Column(DateTime)
+
+    avatar = relationship('Avatar')
+
+
 class TagSet(Base):
     __tablename__ = 'tag_set'
+    __table_args__ = (
+        Index('ix_tag_set_super_active', 'super_id', postgresql_where=text('is_active')),
+    )
 
     id = Column(Integer, primary_key=True)
     super_id = Column(ForeignKey('tag.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -180,8 +248,40 @@ class TagSet(Base):
     super = relationship('Tag', primaryjoin='TagSet.super_id == Tag.id')
 
 
+class TagBookmarkTotal(Base):
+    __tablename__ = 'tag_bookmark_total'
+
+    tag_id = Column(ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+    total = Column(Integer, nullable=False, server_default=text("0"))
+    modified_timestamp = Column(DateTime)
+
+    tag = relationship('Tag')
+
+
+class TagImpact(Base):
+    __tablename__ = 'tag_impact'
+
+    avatar_id = Column(ForeignKey('avatar.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    tag_id = Column(ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    group_cnt = Column(Integer, nullable=False)
+    lag_cnt = Column(Integer, nullable=False)
+    avg_with = Column(REAL)
+    avg_without = Column(REAL)
+    score_diff = Column(REAL)
+    lag_diff = Column(REAL)
+    ci_low = Column(REAL)
+    ci_high = Column(REAL)
+    modified_timestamp = Column(DateTime)
+
+    avatar = relationship('Avatar')
+    tag = relationship('Tag')
+
+
 class TagLog(Base):
     __tablename__ = 'tag_log'
+    __table_args__ = (
+        Index('ix_tag_log_group_active', 'group_id', postgresql_where=text('is_active')),
+    )
 
     id = Column(Integer, primary_key=True)
     group_id = Column(ForeignKey('log_group.id', ondelete='CASCADE'), nullable=False, index=True)
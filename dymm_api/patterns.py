@@ -36,6 +36,8 @@ class MsgPattern:
     OK_UPLOAD = 'Ok, The {} {} data has been uploaded.'
     OK_MODIFY = 'Ok, The {} {} data has been modified.'
     UN_AUTH = 'Unauthorized, Wrong {} has been passed.'
+    REUSED = 'Bad request, {} has been reused for another request.'
+    IN_PROGRESS = 'Conflict, The request with this {} is still in progress.'
 
 
 class RegExPattern:
@@ -52,6 +54,13 @@ class CondLogType:
     end_date = 2
 
 
+class PeriodType:
+    day = 1
+    week = 2
+    month = 3
+    year = 4
+
+
 class TagType:
     activity = 7
     condition = 8
@@ -0,0 +1,96 @@
+import logging, re, time, warnings
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('dymm_api.queries')
+
+_SPACES = re.compile(r'\s+')
+# Expanded IN lists and inline literals would make every call look unique.
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_IN_LISTS = re.compile(r'IN \((?:[^()]|\([^()]*\))*\)')
+
+
+class RepeatedQueryWarning(UserWarning):
+    pass
+
+
+class RepeatedQueryError(RuntimeError):
+    pass
+
+
+class QueryStats(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, limit) -> [tuple]:
+        return [(shape, cnt) for shape, cnt in self.shapes.most_common()
+                if cnt > limit]
+
+
+def statement_shape(statement: str) -> str:
+    shape = _SPACES.sub(' ', statement).strip()
+    shape = _IN_LISTS.sub('IN (...)', shape)
+    return _LITERALS.sub('?', shape)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['query_start_time'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if has_request_context() and 'query_stats' in g:
+        started = conn.info.get('query_start_time', time.perf_counter())
+        g.query_stats.record(statement, time.perf_counter() - started)
+
+
+def register_query_profiler(app):
+    """Count statements, DB time and repeated statement shapes per request.
+
+    Settings: QUERY_PROFILER (on by default), QUERY_PROFILER_HEADERS (adds
+    X-Query-Count and X-Query-Time, defaults to app.debug),
+    QUERY_REPEAT_LIMIT (default 10) and QUERY_REPEAT_RAISE, which turns the
+    N+1 warning into a RepeatedQueryError for test runs.
+    """
+    if not app.config.get('QUERY_PROFILER', True):
+        return
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        db_ms = stats.seconds * 1000
+        logger.info('%s %s %s queries=%d db_ms=%.1f', request.method,
+                    request.path, request.endpoint, stats.count, db_ms)
+        if app.config.get('QUERY_PROFILER_HEADERS', app.debug):
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time'] = '{0:.1f}'.format(db_ms)
+        limit = app.config.get('QUERY_REPEAT_LIMIT', 10)
+        for shape, cnt in stats.repeated(limit):
+            message = '{0} ran {1} times in {2} {3}: {4}'.format(
+                request.endpoint, cnt, request.method, request.path, shape)
+            if app.config.get('QUERY_REPEAT_RAISE', False):
+                raise RepeatedQueryError(message)
+            logger.warning(message)
+            warnings.warn(message, RepeatedQueryWarning)
+        return response
@@ -151,6 +151,35 @@ class Schema:
                      "y_val", "log_date"],
         "additionalProperties": False
     }
+    create_logs = {
+        "type": "object",
+        "properties": {
+            "logs": {
+                "type": "array",
+                "minItems": 1,
+                "maxItems": 200,
+                "items": create_log
+            }
+        },
+        "required": ["logs"],
+        "additionalProperties": False
+    }
+    group_ids = {
+        "type": "object",
+        "properties": {
+            "group_ids": {
+                "type": "array",
+                "minItems": 1,
+                "maxItems": 100,
+                "uniqueItems": True,
+                "items": {
+                    "type": "integer"
+                }
+            }
+        },
+        "required": ["group_ids"],
+        "additionalProperties": False
+    }
     create_avatar_cond = {
         "type": "object",
         "properties": {
@@ -212,6 +241,42 @@ class Schema:
         "required": ["key_word"],
         "additionalProperties": False
     }
+    note_key_word = {
+        "type": "object",
+        "properties": {
+            "key_word": {
+                "type": "string",
+                "minLength": 1,
+                "maxLength": 100
+            },
+            "cursor": {
+                "type": "string",
+                "maxLength": 500
+            }
+        },
+        "required": ["key_word"],
+        "additionalProperties": False
+    }
+    autocomplete_key_word = {
+        "type": "object",
+        "properties": {
+            "key_word": {
+                "type": "string",
+                "maxLength": 100
+            },
+            "locale": {
+                "type": "string",
+                "enum": ["eng", "kor", "jpn"]
+            },
+            "limit": {
+                "type": "integer",
+                "minimum": 1,
+                "maximum": 20
+            }
+        },
+        "required": ["key_word"],
+        "additionalProperties": False
+    }
     mail_conf_link = {
         "type": "object",
         "properties": {
@@ -17,6 +17,7 @@ setup(
         'Flask-JWT-Extended',
         'Flask-Mail',
         'sqlacodegen',
-        'google-cloud-storage'
+        'google-cloud-storage',
+        'numpy'
     ]
 )
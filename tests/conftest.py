@@ -0,0 +1,64 @@
+"""Fixtures for the tests that need the app and a database.
+
+dymm_api reads its settings from dymm_api/config.py, which stays out of the
+repository; when it is missing FixtureConfig stands in for it. The database
+tests run against the Postgres database in DYMM_TEST_DATABASE_URL, whose
+tables are created and dropped by the tests, so point it at a scratch
+database:
+
+    DYMM_TEST_DATABASE_URL=postgresql://localhost/dymm_test python -m pytest
+
+Without it those tests are skipped.
+"""
+import os, sys, types
+
+import pytest
+
+DATABASE_URL = os.environ.get('DYMM_TEST_DATABASE_URL')
+_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'dymm_api', 'config.py')
+
+
+class FixtureConfig(object):
+    TESTING = True
+    SECRET_KEY = 'test-secret-key'
+    SECURITY_PASSWORD_SALT = 'test-password-salt'
+    JWT_SECRET_KEY = 'test-jwt-secret-key'
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    MAIL_SUPPRESS_SEND = True
+
+
+if not os.path.exists(_CONFIG_FILE):
+    _config = types.ModuleType('dymm_api.config')
+    _config.ProductionConfig = FixtureConfig
+    _config.DevelopmentConfig = FixtureConfig
+    sys.modules['dymm_api.config'] = _config
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not DATABASE_URL:
+        pytest.skip('DYMM_TEST_DATABASE_URL is not set')
+    dymm_api = pytest.importorskip('dymm_api')
+    app = dymm_api.app
+    db = dymm_api.db
+    app.config.update(SQLALCHEMY_DATABASE_URI=DATABASE_URL,
+                      TESTING=True,
+                      TAXONOMY_CACHE_TTL=0)
+    with app.app_context():
+        db.session.execute('CREATE SEQUENCE IF NOT EXISTS profile_tag_id_seq')
+        db.session.commit()
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture(scope='session')
+def token(app):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return create_access_token(identity=dict(email='avatar@example.com'),
+                                   fresh=True)
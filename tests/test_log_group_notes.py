@@ -0,0 +1,50 @@
+"""Keyset paging of diary notes. See conftest.py for the database."""
+import datetime
+
+import pytest
+
+AVATAR_ID = 2
+
+
+@pytest.fixture(scope='module')
+def notes(app):
+    from dymm_api import db
+    from dymm_api.models import Avatar, LogGroup
+
+    def log_group(group_id, log_date, group_type):
+        return LogGroup(id=group_id, avatar_id=AVATAR_ID, year_number=2019,
+                        month_number=1, week_of_year=1, day_of_year=1,
+                        group_type=group_type, is_active=True,
+                        log_date=log_date, food_cnt=0, act_cnt=0, drug_cnt=0,
+                        note='note {0}'.format(group_id))
+
+    with app.app_context():
+        db.session.add(Avatar(id=AVATAR_ID, is_active=True, is_admin=False,
+                              is_blocked=False, is_confirmed=True,
+                              email='notes@example.com', password_hash='x',
+                              first_name='First', last_name='Last',
+                              color_code=0))
+        db.session.flush()
+        db.session.add_all([
+            log_group(201, datetime.date(2019, 1, 1), 1),
+            log_group(202, datetime.date(2019, 1, 2), 1),
+            log_group(203, datetime.date(2019, 1, 2), 3),
+            # Written before log_date existed.
+            log_group(204, None, 2),
+        ])
+        db.session.commit()
+    return app
+
+
+def test_note_pages_skip_groups_without_a_date(notes):
+    from dymm_api.helpers import Helpers
+    seen = list()
+    cursor = None
+    with notes.app_context():
+        for _ in range(10):
+            log_groups, cursor = Helpers.get_log_group_note_page(
+                AVATAR_ID, cursor, per_page=1)
+            seen.extend(log_group.id for log_group in log_groups)
+            if cursor is None:
+                break
+    assert seen == [203, 202, 201]
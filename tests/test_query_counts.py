@@ -0,0 +1,160 @@
+"""Statement count of the list endpoints with one row and with many.
+
+Every list getter loads its related Tag rows up front, so the number of
+statements an endpoint sends must not grow with the rows it returns. See
+conftest.py for the database these tests need.
+"""
+import datetime
+
+import pytest
+
+MANY = 30
+AVATAR_ID = 1
+GROUP_ID = 1
+SUPER_TAG_ID = 1000
+LEAF_TAG_ID = 1001
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    from dymm_api import db
+    from dymm_api.models import Avatar, LogGroup, ProfileTag, Tag, TagSet
+    from dymm_api.patterns import (BookmarkSuperTag, TagClass, TagId,
+                                   TagType)
+
+    def tag(tag_id, tag_type, class1=0):
+        return Tag(id=tag_id, tag_type=tag_type, is_active=True,
+                   eng_name='tag {0}'.format(tag_id), class1=class1,
+                   hierarchy_path='{0:05d}'.format(class1),
+                   hierarchy_depth=0)
+
+    with app.app_context():
+        db.session.add_all([
+            Avatar(id=AVATAR_ID, is_active=True, is_admin=False,
+                   is_blocked=False, is_confirmed=True,
+                   email='avatar@example.com', password_hash='x',
+                   first_name='First', last_name='Last', color_code=0,
+                   date_of_birth=datetime.date(1980, 1, 1)),
+            tag(TagId.profile, TagType.category),
+            tag(TagId.language, TagType.category),
+            tag(TagId.eng, TagType.category),
+            tag(BookmarkSuperTag.history, TagType.history),
+            tag(BookmarkSuperTag.food, TagType.bookmark),
+            tag(SUPER_TAG_ID, TagType.food, TagClass.food),
+        ] + [tag(LEAF_TAG_ID + i, TagType.food, TagClass.food)
+             for i in range(MANY)])
+        db.session.flush()
+        db.session.add_all([
+            LogGroup(id=GROUP_ID, avatar_id=AVATAR_ID, year_number=2019,
+                     month_number=1, week_of_year=1, day_of_year=1,
+                     group_type=1, is_active=True,
+                     log_date=datetime.date(2019, 1, 1),
+                     food_cnt=0, act_cnt=0, drug_cnt=0),
+            TagSet(super_id=TagId.profile, sub_id=TagId.language,
+                   is_active=True, priority=MANY),
+            ProfileTag(avatar_id=AVATAR_ID, super_tag_id=TagId.language,
+                       sub_tag_id=TagId.eng, is_active=True,
+                       is_selected=True),
+        ])
+        db.session.commit()
+    return app
+
+
+def add_avatar_conds(models, tag_ids):
+    return [models.AvatarCond(avatar_id=AVATAR_ID, tag_id=tag_id,
+                              is_active=True,
+                              start_date=datetime.date(2019, 1, 1))
+            for tag_id in tag_ids]
+
+
+def add_tag_logs(models, tag_ids):
+    return [models.TagLog(group_id=GROUP_ID, tag_id=tag_id, is_active=True)
+            for tag_id in tag_ids]
+
+
+def add_tag_sets(models, tag_ids):
+    return [models.TagSet(super_id=SUPER_TAG_ID, sub_id=tag_id,
+                          is_active=True, priority=0)
+            for tag_id in tag_ids]
+
+
+def add_bookmarks(models, tag_ids):
+    from dymm_api.patterns import BookmarkSuperTag
+    return [models.Bookmark(avatar_id=AVATAR_ID,
+                            super_tag_id=BookmarkSuperTag.food,
+                            sub_tag_id=tag_id, is_active=True)
+            for tag_id in tag_ids]
+
+
+def add_log_histories(models, tag_ids):
+    return [models.LogHistory(avatar_id=AVATAR_ID, tag_id=tag_id,
+                              is_active=True,
+                              modified_timestamp=datetime.datetime.utcnow())
+            for tag_id in tag_ids]
+
+
+def add_profile_tags(models, tag_ids):
+    from dymm_api.patterns import TagId
+    rows = list()
+    for tag_id in tag_ids:
+        rows.append(models.TagSet(super_id=TagId.profile, sub_id=tag_id,
+                                  is_active=True, priority=0))
+        rows.append(models.ProfileTag(avatar_id=AVATAR_ID,
+                                      super_tag_id=tag_id, sub_tag_id=tag_id,
+                                      is_active=True, is_selected=False))
+    return rows
+
+
+# Paths are formatted with the avatar, group and super tag ids above and
+# b=BookmarkSuperTag once the package has been imported.
+LIST_ENDPOINTS = [
+    ('/api/avatar/{avatar_id}/cond', add_avatar_conds),
+    ('/api/avatar/group/{group_id}/log', add_tag_logs),
+    ('/api/tag/{super_tag_id}/set/eng', add_tag_sets),
+    ('/api/tag/{b.food}/set/eng/avt/{avatar_id}/page/1', add_bookmarks),
+    ('/api/tag/{b.history}/set/eng/avt/{avatar_id}/page/1',
+     add_log_histories),
+    ('/api/avatar/{avatar_id}/profile', add_profile_tags),
+]
+
+
+def query_count(app, token, path) -> int:
+    from sqlalchemy import event
+    from dymm_api import db
+    from dymm_api.caches import taxonomy_cache
+    statements = list()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    # Every request starts from a cold taxonomy cache, so the counts only
+    # differ by what the endpoint itself loads.
+    taxonomy_cache.clear()
+    event.listen(engine, 'after_cursor_execute', record)
+    try:
+        response = app.test_client().get(
+            path, headers={'Authorization': 'Bearer ' + token})
+    finally:
+        event.remove(engine, 'after_cursor_execute', record)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements)
+
+
+@pytest.mark.parametrize('path, add_rows', LIST_ENDPOINTS)
+def test_query_count_does_not_grow_with_rows(seeded, token, path, add_rows):
+    from dymm_api import db, models
+    from dymm_api.patterns import BookmarkSuperTag
+    path = path.format(avatar_id=AVATAR_ID, group_id=GROUP_ID,
+                       super_tag_id=SUPER_TAG_ID, b=BookmarkSuperTag)
+    with seeded.app_context():
+        db.session.add_all(add_rows(models, [LEAF_TAG_ID]))
+        db.session.commit()
+    one_row = query_count(seeded, token, path)
+    with seeded.app_context():
+        db.session.add_all(add_rows(
+            models, range(LEAF_TAG_ID + 1, LEAF_TAG_ID + MANY)))
+        db.session.commit()
+    many_rows = query_count(seeded, token, path)
+    assert many_rows == one_row, path